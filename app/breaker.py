@@ -0,0 +1,161 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from .config import settings
+from .metrics import metrics
+from .renderer import ServiceUnavailableError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {HALF_OPEN: 1, OPEN: 2}
+_STATE_METRIC = "circuit_breaker_state"
+# Hosts tracked before the least recently rendered is forgotten
+_MAX_HOSTS = 1000
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Circuit breaker open for {host}; retry in {retry_after:.0f}s", retry_after)
+        self.host = host
+
+
+class CircuitBreaker:
+    """Failure tracking for one host over a sliding time window.
+
+    Closed: renders pass and outcomes are recorded. Opens when enough renders
+    in the window failed. Open: renders are rejected until the cooldown has
+    passed. Half-open: a limited number of probe renders pass; enough
+    successes close the breaker, any failure opens it again.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self._events: deque[tuple[float, bool]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        # Only hosts that are not closed are exported, so the series stay few
+        if state == CLOSED:
+            metrics.remove(_STATE_METRIC, labels={"host": self.host})
+        else:
+            metrics.set(
+                _STATE_METRIC, "Breaker state per host that is not closed (1 half-open, 2 open)",
+                _STATE_VALUES[state], labels={"host": self.host},
+            )
+
+    def _prune(self, now: float) -> None:
+        while self._events and self._events[0][0] < now - settings.BREAKER_WINDOW:
+            self._events.popleft()
+
+    def _open(self, now: float) -> None:
+        self.opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._set_state(OPEN)
+        metrics.inc("circuit_breaker_opened_total", "Times a breaker opened, over all hosts")
+
+    def acquire(self, now: float) -> bool:
+        """Admit a render, returning whether it is a half-open probe.
+
+        Raises CircuitOpenError when the render must not run.
+        """
+        if self.state == OPEN:
+            remaining = self.opened_at + settings.BREAKER_COOLDOWN - now
+            if remaining > 0:
+                metrics.inc("circuit_breaker_rejections_total", "Renders rejected by an open breaker, over all hosts")
+                raise CircuitOpenError(self.host, remaining)
+            self._set_state(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= settings.BREAKER_HALF_OPEN_PROBES:
+                metrics.inc("circuit_breaker_rejections_total", "Renders rejected by an open breaker, over all hosts")
+                raise CircuitOpenError(self.host, settings.BREAKER_COOLDOWN)
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def record(self, success: bool, probe: bool, now: float) -> None:
+        if probe:
+            self._release_probe()
+            if self.state != HALF_OPEN:
+                return
+            if not success:
+                self._open(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= settings.BREAKER_HALF_OPEN_PROBES:
+                self._events.clear()
+                self.opened_at = None
+                self._set_state(CLOSED)
+            return
+
+        self._events.append((now, success))
+        self._prune(now)
+        if self.state != CLOSED or len(self._events) < settings.BREAKER_MIN_REQUESTS:
+            return
+        failures = sum(1 for _, ok in self._events if not ok)
+        if failures / len(self._events) >= settings.BREAKER_FAILURE_RATE:
+            self._open(now)
+
+    def release(self, probe: bool) -> None:
+        """Give back a probe slot for a render that ended without an outcome."""
+        if probe:
+            self._release_probe()
+
+    def _release_probe(self) -> None:
+        # Probes admitted before the breaker last opened were already dropped from the count
+        self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def info(self, now: float) -> dict:
+        self._prune(now)
+        failures = sum(1 for _, ok in self._events if not ok)
+        retry_after = None
+        if self.state == OPEN:
+            retry_after = max(self.opened_at + settings.BREAKER_COOLDOWN - now, 0.0)
+        return {
+            "host": self.host,
+            "state": self.state,
+            "requests": len(self._events),
+            "failures": failures,
+            "retry_after": retry_after,
+        }
+
+
+class BreakerRegistry:
+    """Circuit breakers per host, bounded with LRU eviction."""
+
+    def __init__(self, max_hosts: int = _MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self._breakers: OrderedDict[str, CircuitBreaker] = OrderedDict()
+
+    def get(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        self._breakers.move_to_end(host)
+        while len(self._breakers) > self.max_hosts:
+            _, evicted = self._breakers.popitem(last=False)
+            metrics.remove(_STATE_METRIC, labels={"host": evicted.host})
+        return breaker
+
+    def find(self, host: str) -> Optional[CircuitBreaker]:
+        return self._breakers.get(host)
+
+    def reset(self, host: str) -> bool:
+        if self._breakers.pop(host, None) is None:
+            return False
+        metrics.remove(_STATE_METRIC, labels={"host": host})
+        return True
+
+    def all(self, now: Optional[float] = None) -> list[dict]:
+        now = time.monotonic() if now is None else now
+        return [breaker.info(now) for breaker in self._breakers.values()]
+
+
+breakers = BreakerRegistry()
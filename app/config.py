@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -11,9 +12,65 @@ class Settings:
     JS_WEB_RENDERER_PATH: Path = Path(
         os.getenv("JS_WEB_RENDERER_PATH", "/opt/js-web-renderer/bin/fetch-rendered.py")
     )
+    # Ask the renderer for framed output (requires a renderer supporting --framed-output)
+    RENDERER_FRAMED_OUTPUT: bool = os.getenv("RENDERER_FRAMED_OUTPUT", "false").lower() in ("1", "true", "yes")
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "9000"))
     MAX_INSTANCES: int = int(os.getenv("MAX_INSTANCES", "4"))
+    # Seconds in-flight renders get to finish after SIGTERM before they are killed
+    DRAIN_TIMEOUT: float = float(os.getenv("DRAIN_TIMEOUT", "60"))
+    # Page rendered on startup before reporting ready (empty disables warm-up)
+    WARMUP_URL: str = os.getenv("WARMUP_URL", "")
+    WARMUP_WAIT: int = int(os.getenv("WARMUP_WAIT", "2"))
+    WARMUP_ATTEMPTS: int = int(os.getenv("WARMUP_ATTEMPTS", "3"))
+    # Extra attempts for renders failing with a transient error (0 disables)
+    RENDER_RETRIES: int = int(os.getenv("RENDER_RETRIES", "1"))
+    RETRY_BACKOFF: float = float(os.getenv("RETRY_BACKOFF", "1.0"))
+    RETRY_TRANSIENT_PATTERNS: list[str] = [
+        p.strip() for p in os.getenv(
+            "RETRY_TRANSIENT_PATTERNS",
+            "timed out,net::ERR_,Target closed,has been closed,crashed,ECONNRESET,exited with code -",
+        ).split(",") if p.strip()
+    ]
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY: float = float(os.getenv("HEDGE_MIN_DELAY", "2.0"))
+    BREAKER_ENABLED: bool = os.getenv("BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+    BREAKER_WINDOW: float = float(os.getenv("BREAKER_WINDOW", "60"))
+    BREAKER_MIN_REQUESTS: int = int(os.getenv("BREAKER_MIN_REQUESTS", "5"))
+    BREAKER_FAILURE_RATE: float = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+    BREAKER_COOLDOWN: float = float(os.getenv("BREAKER_COOLDOWN", "30"))
+    BREAKER_HALF_OPEN_PROBES: int = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+    # Enable /session (requires a renderer supporting --session with --framed-output)
+    SESSIONS_ENABLED: bool = os.getenv("SESSIONS_ENABLED", "false").lower() in ("1", "true", "yes")
+    MAX_SESSIONS: int = int(os.getenv("MAX_SESSIONS", "2"))
+    # Per-request scratch files (screenshots); tmpfs-backed /dev/shm by default
+    SCRATCH_DIR: Path = Path(
+        os.getenv(
+            "SCRATCH_DIR",
+            "/dev/shm/js-web-renderer" if Path("/dev/shm").is_dir()
+            else str(Path(tempfile.gettempdir()) / "js-web-renderer"),
+        )
+    )
+    FS_WORKERS: int = int(os.getenv("FS_WORKERS", "4"))
+    CACHE_PROXY_ENABLED: bool = os.getenv("CACHE_PROXY_ENABLED", "false").lower() in ("1", "true", "yes")
+    CACHE_PROXY_PORT: int = int(os.getenv("CACHE_PROXY_PORT", "9001"))
+    CACHE_PROXY_DIR: Path = Path(os.getenv("CACHE_PROXY_DIR", "/opt/js-web-renderer/cache"))
+    CACHE_PROXY_MAX_BYTES: int = int(os.getenv("CACHE_PROXY_MAX_BYTES", str(1024 ** 3)))
+    CACHE_PROXY_MAX_OBJECT_BYTES: int = int(os.getenv("CACHE_PROXY_MAX_OBJECT_BYTES", str(20 * 1024 ** 2)))
+    CACHE_PROXY_STATIC_TTL: int = int(os.getenv("CACHE_PROXY_STATIC_TTL", "86400"))
+    # Intercept and cache HTTPS (requires a renderer supporting --proxy-ca/--proxy-ca-spki)
+    CACHE_PROXY_INTERCEPT_TLS: bool = os.getenv("CACHE_PROXY_INTERCEPT_TLS", "false").lower() in ("1", "true", "yes")
+    CACHE_PROXY_CA_DIR: Path = Path(os.getenv("CACHE_PROXY_CA_DIR", "/opt/js-web-renderer/proxy-ca"))
+    EXTRACT_WORKERS: int = int(os.getenv("EXTRACT_WORKERS", "2"))
+    FINGERPRINT_MAX_ENTRIES: int = int(os.getenv("FINGERPRINT_MAX_ENTRIES", "10000"))
+    FINGERPRINT_MAX_BYTES: int = int(os.getenv("FINGERPRINT_MAX_BYTES", str(64 * 1024 ** 2)))
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+    SCHEDULER_DB: Path = Path(os.getenv("SCHEDULER_DB", "/home/js-web-render/scheduler/scheduler.db"))
+    SCHEDULER_MAX_CONCURRENT: int = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "2"))
+    SCHEDULE_HISTORY_LIMIT: int = int(os.getenv("SCHEDULE_HISTORY_LIMIT", "20"))
+    SCHEDULE_MIN_INTERVAL: int = int(os.getenv("SCHEDULE_MIN_INTERVAL", "60"))
 
 
 settings = Settings()
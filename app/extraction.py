@@ -0,0 +1,299 @@
+import asyncio
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from urllib.parse import urljoin, urldefrag
+
+import lxml.html
+from cssselect import SelectorError
+from lxml import etree
+
+from .config import settings
+
+
+class ExtractionError(Exception):
+    pass
+
+
+# Elements that never contribute to readable content
+_STRIP_TAGS = ("script", "style", "noscript", "template", "iframe", "svg", "canvas", "form")
+# Page chrome dropped before scoring main-content candidates
+_CHROME_TAGS = ("nav", "header", "footer", "aside")
+_CANDIDATE_TAGS = ("article", "main", "section", "div", "td")
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr",
+    "blockquote", "pre", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr",
+}
+_WS_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _parse(html: str, base_url: Optional[str]):
+    if not html or not html.strip():
+        raise ExtractionError("No HTML to extract from")
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError) as e:
+        raise ExtractionError(f"Failed to parse HTML: {e}")
+
+    # A <base href> in the document takes precedence over the page URL
+    base_href = doc.xpath("string(//head/base/@href)")
+    if base_href:
+        base_url = urljoin(base_url or "", base_href)
+    return doc, base_url
+
+
+def _normalize(text: str) -> str:
+    lines = [_WS_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _block_text(node) -> str:
+    """Text content of a node with line breaks at block boundaries."""
+    parts = []
+
+    def walk(el):
+        if isinstance(el.tag, str):
+            block = el.tag in _BLOCK_TAGS
+            if block:
+                parts.append("\n")
+            if el.text:
+                parts.append(el.text)
+            for child in el:
+                walk(child)
+            if block:
+                parts.append("\n")
+        if el.tail:
+            parts.append(el.tail)
+
+    if node.text:
+        parts.append(node.text)
+    for child in node:
+        walk(child)
+    return _normalize("".join(parts))
+
+
+def _link_density(node) -> float:
+    text_len = len(node.text_content().strip())
+    if not text_len:
+        return 1.0
+    link_len = sum(len(a.text_content().strip()) for a in node.iter("a"))
+    return link_len / text_len
+
+
+def _main_content(doc):
+    """Pick the element most likely to hold the page's main content.
+
+    Candidates are scored by the amount of paragraph text they directly
+    contain, penalised by link density so menus and link farms lose out.
+    """
+    body = doc.find("body")
+    if body is None:
+        body = doc
+
+    for el in list(body.iter(*_STRIP_TAGS, *_CHROME_TAGS)):
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    best, best_score = None, 0.0
+    for el in body.iter(*_CANDIDATE_TAGS):
+        paragraph_len = sum(
+            len(p.text_content().strip())
+            for p in el
+            if isinstance(p.tag, str) and p.tag in ("p", "pre", "blockquote")
+        )
+        if not paragraph_len:
+            continue
+        score = paragraph_len * (1.0 - _link_density(el))
+        if el.tag in ("article", "main"):
+            score *= 1.5
+        if score > best_score:
+            best, best_score = el, score
+
+    return best if best is not None else body
+
+
+def _resolve(base_url: Optional[str], href: str) -> str:
+    """Absolute URL of a link without its fragment."""
+    url, _ = urldefrag(urljoin(base_url or "", href))
+    return url
+
+
+def _markdown(node, base_url: Optional[str]) -> str:
+    """Convert an element tree to Markdown."""
+
+    def inline(el) -> str:
+        parts = [el.text or ""]
+        for child in el:
+            parts.append(render(child))
+            parts.append(child.tail or "")
+        return _WS_RE.sub(" ", "".join(parts).replace("\n", " "))
+
+    def render(el) -> str:
+        tag = el.tag if isinstance(el.tag, str) else None
+        if tag is None or tag in _STRIP_TAGS:
+            return ""
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            return f"\n\n{'#' * int(tag[1])} {inline(el).strip()}\n\n"
+        if tag == "p":
+            return f"\n\n{inline(el).strip()}\n\n"
+        if tag == "br":
+            return "  \n"
+        if tag == "hr":
+            return "\n\n---\n\n"
+        if tag in ("strong", "b"):
+            text = inline(el).strip()
+            return f"**{text}**" if text else ""
+        if tag in ("em", "i"):
+            text = inline(el).strip()
+            return f"*{text}*" if text else ""
+        if tag == "code":
+            return f"`{el.text_content()}`"
+        if tag == "pre":
+            return f"\n\n```\n{el.text_content().strip(chr(10))}\n```\n\n"
+        if tag == "a":
+            text = inline(el).strip()
+            href = el.get("href")
+            if not href or href.startswith(("javascript:", "#")):
+                return text
+            return f"[{text}]({_resolve(base_url, href)})"
+        if tag == "img":
+            src = el.get("src")
+            if not src:
+                return ""
+            return f"![{el.get('alt', '')}]({urljoin(base_url or '', src)})"
+        if tag in ("ul", "ol"):
+            items = []
+            for index, li in enumerate(el.findall("li"), start=1):
+                marker = f"{index}." if tag == "ol" else "-"
+                items.append(f"{marker} {inline(li).strip()}")
+            return "\n\n" + "\n".join(items) + "\n\n"
+        if tag == "blockquote":
+            text = _normalize(children(el))
+            return "\n\n" + "\n".join(f"> {line}" for line in text.split("\n")) + "\n\n"
+        return children(el)
+
+    def children(el) -> str:
+        parts = [el.text or ""]
+        for child in el:
+            parts.append(render(child))
+            parts.append(child.tail or "")
+        return "".join(parts)
+
+    return _normalize(children(node))
+
+
+def _links(doc, base_url: Optional[str]) -> list[dict]:
+    links = []
+    seen = set()
+    for a in doc.iter("a"):
+        href = (a.get("href") or "").strip()
+        if not href or href.startswith(("javascript:", "mailto:", "tel:", "#")):
+            continue
+        url = _resolve(base_url, href)
+        if url in seen:
+            continue
+        seen.add(url)
+        links.append({"url": url, "text": _WS_RE.sub(" ", a.text_content()).strip()})
+    return links
+
+
+def _serialize(value) -> str:
+    if isinstance(value, etree._Element):
+        return lxml.html.tostring(value, encoding="unicode", with_tail=False)
+    return str(value)
+
+
+def _css(doc, selectors: list[str]) -> dict[str, list[str]]:
+    results = {}
+    for selector in selectors:
+        try:
+            matches = doc.cssselect(selector)
+        except SelectorError as e:
+            raise ExtractionError(f"Invalid CSS selector '{selector}': {e}")
+        results[selector] = [_serialize(m) for m in matches]
+    return results
+
+
+def _xpath(doc, expressions: list[str]) -> dict[str, list[str]]:
+    results = {}
+    for expression in expressions:
+        try:
+            matches = doc.xpath(expression)
+        except etree.XPathError as e:
+            raise ExtractionError(f"Invalid XPath expression '{expression}': {e}")
+        if not isinstance(matches, list):
+            matches = [matches]
+        results[expression] = [_serialize(m) for m in matches]
+    return results
+
+
+def extract(html: str, base_url: Optional[str], options: dict) -> dict:
+    """Run the requested extractions over rendered HTML.
+
+    Runs in a worker process, so it takes and returns plain data only.
+    """
+    doc, base_url = _parse(html, base_url)
+    result = {}
+
+    # Selector-based extraction and links run against the full document,
+    # before the readability pass strips page chrome from the tree.
+    if options.get("css"):
+        result["css"] = _css(doc, options["css"])
+    if options.get("xpath"):
+        result["xpath"] = _xpath(doc, options["xpath"])
+    if options.get("links"):
+        result["links"] = _links(doc, base_url)
+
+    if options.get("text") or options.get("markdown"):
+        content = _main_content(doc)
+        if options.get("text"):
+            result["text"] = _block_text(content)
+        if options.get("markdown"):
+            result["markdown"] = _markdown(content, base_url)
+
+    return result
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Not forked: the API process already runs filesystem and other worker threads
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _executor
+
+
+async def run_in_pool(func, *args):
+    """Run a CPU-bound function in the worker pool, off the event loop."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # A worker died, e.g. out of memory on a huge page; the pool is
+        # unusable from now on, so the next call starts a new one
+        if _executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        raise ExtractionError("Extraction worker crashed")
+
+
+async def run_extraction(html: str, base_url: Optional[str], options: dict) -> dict:
+    """Run extraction in the worker pool so parsing does not block the event loop."""
+    return await run_in_pool(extract, html, base_url, options)
+
+
+def shutdown_extraction() -> None:
+    """Stop the extraction worker pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,180 @@
+import difflib
+import hashlib
+import json
+import re
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import lxml.html
+from lxml import etree
+
+from .config import settings
+from .extraction import run_in_pool
+
+_TAG_BOUNDARY_RE = re.compile(r">\s*<")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SHINGLE_SIZE = 3
+_SIMHASH_BITS = 64
+# Approximate bytes per stored fingerprint besides its compressed lines
+_ENTRY_OVERHEAD = 256
+
+
+@dataclass
+class Fingerprint:
+    content_hash: str
+    simhash: int
+    # zlib-compressed structural lines, kept only to diff against the next render
+    lines: bytes
+
+
+def request_key(url: str, params: dict) -> str:
+    """Stable key for a URL plus the request options that affect its output."""
+    payload = json.dumps({"url": url, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _structural_lines(html: str) -> list[str]:
+    """Split HTML into one tag per line so diffs follow document structure."""
+    return [line.strip() for line in _TAG_BOUNDARY_RE.sub(">\n<", html).split("\n") if line.strip()]
+
+
+def _text(html: str) -> str:
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ""
+    for el in list(doc.iter("script", "style", "noscript", "template")):
+        if el.getparent() is not None:
+            el.drop_tree()
+    return doc.text_content()
+
+
+def simhash(text: str) -> int:
+    """64-bit simhash over word shingles; near-identical texts differ in few bits."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)]
+
+    weights = [0] * _SIMHASH_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(_SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(_SIMHASH_BITS) if weights[bit] > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def fingerprint(html: str) -> Fingerprint:
+    """Compute the fingerprint of a rendered page.
+
+    Runs in a worker process, so it takes and returns plain data only.
+    """
+    lines = _structural_lines(html)
+    return Fingerprint(
+        content_hash=hashlib.sha256(html.encode()).hexdigest(),
+        simhash=simhash(_text(html)),
+        lines=zlib.compress("\n".join(lines).encode()),
+    )
+
+
+def diff_size(lines: list[str]) -> int:
+    return sum(len(line) + 1 for line in lines)
+
+
+def diff(previous: Fingerprint, current: Fingerprint) -> list[str]:
+    """Unified diff of the structural lines of two fingerprints."""
+    old = zlib.decompress(previous.lines).decode().split("\n")
+    new = zlib.decompress(current.lines).decode().split("\n")
+    return list(difflib.unified_diff(
+        old, new,
+        fromfile=previous.content_hash,
+        tofile=current.content_hash,
+        lineterm="",
+    ))
+
+
+def _entry_size(entry: Fingerprint) -> int:
+    return len(entry.lines) + _ENTRY_OVERHEAD
+
+
+class FingerprintStore:
+    """Latest fingerprint per request key, bounded in count and bytes with LRU eviction."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, Fingerprint] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Fingerprint]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: Fingerprint) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= _entry_size(previous)
+        if _entry_size(entry) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.size += _entry_size(entry)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= _entry_size(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+fingerprint_store = FingerprintStore(settings.FINGERPRINT_MAX_ENTRIES, settings.FINGERPRINT_MAX_BYTES)
+
+
+async def detect_changes(
+    key: str,
+    html: str,
+    if_changed_since: Optional[str] = None,
+    tolerance: int = 0,
+) -> dict:
+    """Fingerprint a render and compare it against the client's last known version.
+
+    Returns the fingerprint to hand back to the client, whether the page is
+    unchanged, and a structural diff when the previous version is still stored
+    and the diff is smaller than the page itself.
+    """
+    current = await run_in_pool(fingerprint, html or "")
+    previous = fingerprint_store.get(key)
+
+    if if_changed_since and previous is not None and previous.content_hash == if_changed_since:
+        if current.content_hash == previous.content_hash or (
+            tolerance and hamming_distance(current.simhash, previous.simhash) <= tolerance
+        ):
+            # Within tolerance the stored version stays the baseline, so the
+            # client's fingerprint remains valid for the next comparison.
+            return {"fingerprint": previous.content_hash, "not_modified": True, "diff": None}
+        fingerprint_store.put(key, current)
+        changes = await run_in_pool(diff, previous, current)
+        if diff_size(changes) >= len(html or ""):
+            # Rewrites of most of the page are cheaper to send in full
+            changes = None
+        return {
+            "fingerprint": current.content_hash,
+            "not_modified": False,
+            "diff": changes,
+        }
+
+    fingerprint_store.put(key, current)
+    return {
+        "fingerprint": current.content_hash,
+        "not_modified": if_changed_since == current.content_hash,
+        "diff": None,
+    }
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from .config import settings
+
+_WORKSPACE_PREFIX = "req-"
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.FS_WORKERS, thread_name_prefix="fs")
+    return _executor
+
+
+async def run_fs(func, *args, **kwargs):
+    """Run blocking filesystem work in the bounded filesystem thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(func, *args, **kwargs))
+
+
+def shutdown_fs() -> None:
+    """Stop the filesystem thread pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _cleanup_orphans(scratch_dir: Path) -> int:
+    """Remove workspaces left behind by processes that are no longer running."""
+    scratch_dir.mkdir(parents=True, exist_ok=True)
+    removed = 0
+    for entry in scratch_dir.iterdir():
+        if not entry.name.startswith(_WORKSPACE_PREFIX):
+            continue
+        try:
+            pid = int(entry.name[len(_WORKSPACE_PREFIX):].split("-", 1)[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and _pid_alive(pid):
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+async def cleanup_orphans() -> int:
+    """Remove orphaned workspaces from the scratch directory."""
+    return await run_fs(_cleanup_orphans, settings.SCRATCH_DIR)
+
+
+def _make_workspace(scratch_dir: Path) -> Path:
+    path = scratch_dir / f"{_WORKSPACE_PREFIX}{os.getpid()}-{uuid.uuid4().hex}"
+    path.mkdir(parents=True)
+    return path
+
+
+@asynccontextmanager
+async def workspace() -> AsyncIterator[Path]:
+    """Per-request scratch directory, removed with its contents on exit."""
+    path = await run_fs(_make_workspace, settings.SCRATCH_DIR)
+    try:
+        yield path
+    finally:
+        # Shielded so a cancelled request still cleans up after itself
+        await asyncio.shield(run_fs(shutil.rmtree, path, ignore_errors=True))
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of all files below a directory."""
+    total = 0
+    for item in path.rglob("*"):
+        if item.is_file():
+            total += item.stat().st_size
+    return total
+
+
+def list_subdirectories(path: Path) -> list[str]:
+    """Names of the directories directly below a path, or [] if it does not exist."""
+    if not path.exists():
+        return []
+    return [item.name for item in path.iterdir() if item.is_dir()]
@@ -0,0 +1,121 @@
+"""Startup warm-up, readiness and graceful drain on SIGTERM.
+
+On SIGTERM the API stops admitting renders and sessions (they get HTTP 503)
+and reports not ready, gives in-flight work up to ``DRAIN_TIMEOUT`` seconds
+to finish, kills the process groups of renderers still running, and only then
+passes the signal on to uvicorn, which stops serving and runs the shutdown
+handlers.
+"""
+import asyncio
+import signal
+import threading
+import time
+from typing import Optional
+
+from .config import settings
+from .metrics import metrics
+from .renderer import (
+    RendererError,
+    get_active_instances,
+    is_draining,
+    is_renderer_available,
+    kill_renderers,
+    run_renderer,
+    start_draining,
+)
+from .sessions import get_active_sessions
+
+# Seconds between checks for in-flight work while draining
+_DRAIN_POLL = 0.2
+# Seconds between failed warm-up attempts
+_WARMUP_RETRY_DELAY = 2
+
+# Not ready until the warm-up render has run
+_warming = bool(settings.WARMUP_URL)
+_drain_task: Optional[asyncio.Task] = None
+
+
+async def warm_up() -> None:
+    """Render WARMUP_URL so the first real request does not pay for a cold start.
+
+    Readiness is held back until a warm-up render succeeds or all
+    WARMUP_ATTEMPTS have failed, so an unreachable warm-up page delays
+    readiness but does not keep the API out of rotation.
+    """
+    global _warming
+    if not settings.WARMUP_URL:
+        return
+    start = time.monotonic()
+    try:
+        for attempt in range(settings.WARMUP_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(_WARMUP_RETRY_DELAY)
+            try:
+                await run_renderer(url=settings.WARMUP_URL, wait=settings.WARMUP_WAIT)
+            except RendererError:
+                metrics.inc("warmup_failures_total", "Startup warm-up renders that failed")
+                continue
+            metrics.set("warmup_seconds", "Time the startup warm-up took", time.monotonic() - start)
+            return
+    finally:
+        _warming = False
+
+
+def not_ready_reasons() -> list[str]:
+    """Why the API should not get new traffic right now; empty when ready."""
+    reasons = []
+    if is_draining():
+        reasons.append("draining")
+    if _warming:
+        reasons.append("warming_up")
+    if not is_renderer_available():
+        reasons.append("renderer_unavailable")
+    if get_active_instances() >= settings.MAX_INSTANCES:
+        reasons.append("at_capacity")
+    return reasons
+
+
+async def drain(timeout: float) -> None:
+    """Stop admitting work, wait for in-flight renders, then kill what is left."""
+    start_draining()
+    metrics.set("draining", "1 while the API drains for shutdown", 1)
+    deadline = time.monotonic() + timeout
+    while get_active_instances() or get_active_sessions():
+        if time.monotonic() >= deadline:
+            killed = kill_renderers()
+            metrics.inc("drain_killed_renderers_total", "Renderers killed when the drain deadline passed", killed)
+            return
+        await asyncio.sleep(_DRAIN_POLL)
+
+
+def install_drain_handler() -> None:
+    """Drain on SIGTERM before handing the signal to the server's own handler.
+
+    Signal handlers can only be set from the main thread, so this does
+    nothing when the app runs elsewhere (e.g. under a test client).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def drained(task: asyncio.Task) -> None:
+        signal.signal(signal.SIGTERM, previous)
+        if callable(previous):
+            previous(signal.SIGTERM, None)
+        else:
+            signal.raise_signal(signal.SIGTERM)
+
+    def start_drain() -> None:
+        global _drain_task
+        _drain_task = loop.create_task(drain(settings.DRAIN_TIMEOUT))
+        _drain_task.add_done_callback(drained)
+
+    def handle_sigterm(signum, frame) -> None:
+        if is_draining():
+            return
+        # Refuse new work at once; the drain itself runs on the event loop
+        start_draining()
+        loop.call_soon_threadsafe(start_drain)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
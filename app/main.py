@@ -1,14 +1,29 @@
+import asyncio
+import logging
+import math
 import os
 import shutil
+import sqlite3
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-from fastapi import Depends, FastAPI, HTTPException, status
-from fastapi.responses import Response
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
 from .auth import verify_api_key
+from .breaker import breakers
 from .config import settings
+from .extraction import ExtractionError, run_extraction, shutdown_extraction
+from .fingerprints import detect_changes, request_key
+from .fs import cleanup_orphans, directory_size, list_subdirectories, run_fs, shutdown_fs
+from .lifecycle import install_drain_handler, not_ready_reasons, warm_up
+from .metrics import metrics, monitor_loop_lag
 from .models import (
+    BreakerInfo,
+    BreakerListResponse,
+    ExtractResult,
     HealthResponse,
     NetworkRequest,
     NetworkResponse,
@@ -16,31 +31,155 @@ from .models import (
     ProfileCreateResponse,
     ProfileInfo,
     ProfileListResponse,
+    ReadinessResponse,
     RenderRequest,
     RenderResponse,
+    ScheduleCreateRequest,
+    ScheduleInfo,
+    ScheduleListResponse,
+    ScheduleResult,
+    ScheduleResultsResponse,
     ScreenshotRequest,
+    SessionRequest,
+    SessionStep,
+    SessionStepResult,
 )
-from .renderer import ConcurrencyLimitError, RendererError, get_active_instances, is_renderer_available, run_renderer
+from .proxy import CacheProxy, DiskCache
+from .tls import CertificateAuthority
+from .renderer import (
+    ConcurrencyLimitError,
+    RendererError,
+    ServiceUnavailableError,
+    get_active_instances,
+    is_renderer_available,
+    set_proxy_url,
+)
+from .retries import render_with_retries
+from .scheduler import Scheduler, ScheduleStore
+from .sessions import RendererSession, check_session_admission, get_active_sessions
+
+logger = logging.getLogger(__name__)
+
+cache_proxy: CacheProxy | None = None
+schedule_store: ScheduleStore | None = None
+scheduler: Scheduler | None = None
+
+
+async def run_scheduled(kind: str, request: dict) -> tuple[dict | None, bytes | None]:
+    """Run a scheduled request through the same code path as the API endpoints."""
+    try:
+        if kind == "render":
+            response = await render_page(RenderRequest(**request), "")
+            return response.model_dump(), None
+        response = await take_screenshot(ScreenshotRequest(**request), "")
+        return None, response.body
+    except HTTPException as e:
+        if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            raise ConcurrencyLimitError(e.detail)
+        raise RendererError(e.detail)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global cache_proxy, schedule_store, scheduler
+    await cleanup_orphans()
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+
+    if settings.CACHE_PROXY_ENABLED:
+        ca = None
+        if settings.CACHE_PROXY_INTERCEPT_TLS:
+            ca = await run_fs(CertificateAuthority, settings.CACHE_PROXY_CA_DIR)
+        cache_proxy = CacheProxy(
+            DiskCache(settings.CACHE_PROXY_DIR, settings.CACHE_PROXY_MAX_BYTES),
+            static_ttl=settings.CACHE_PROXY_STATIC_TTL,
+            max_object_bytes=settings.CACHE_PROXY_MAX_OBJECT_BYTES,
+            ca=ca,
+        )
+        await cache_proxy.start("127.0.0.1", settings.CACHE_PROXY_PORT)
+        set_proxy_url(f"http://127.0.0.1:{cache_proxy.port}", ca)
+
+    install_drain_handler()
+    warmup = asyncio.create_task(warm_up())
+
+    if settings.SCHEDULER_ENABLED:
+        try:
+            schedule_store = await run_fs(
+                ScheduleStore, settings.SCHEDULER_DB, settings.SCHEDULE_HISTORY_LIMIT
+            )
+        except (OSError, sqlite3.Error):
+            # A bad SCHEDULER_DB must not keep the API from starting
+            logger.exception("Cannot open schedule store %s; scheduler disabled", settings.SCHEDULER_DB)
+        else:
+            scheduler = Scheduler(schedule_store, run_scheduled, settings.SCHEDULER_MAX_CONCURRENT)
+            scheduler.start()
+
+    yield
+
+    warmup.cancel()
+    if scheduler:
+        await scheduler.stop()
+    if schedule_store:
+        await run_fs(schedule_store.close)
+    if cache_proxy:
+        set_proxy_url(None)
+        await cache_proxy.stop()
+    lag_monitor.cancel()
+    shutdown_extraction()
+    shutdown_fs()
+
 
 app = FastAPI(
     title="js-web-renderer REST API",
     description="REST API for rendering JavaScript-heavy web pages",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
-# Health check (no auth required)
+# Health checks (no auth required)
 @app.get("/health", response_model=HealthResponse, tags=["System"])
 async def health_check():
     """Health check endpoint."""
+    reasons = not_ready_reasons()
     return HealthResponse(
-        status="healthy",
+        status=reasons[0] if reasons else "healthy",
         renderer_available=is_renderer_available(),
         active_instances=get_active_instances(),
         max_instances=settings.MAX_INSTANCES,
+        active_sessions=get_active_sessions(),
+        max_sessions=settings.MAX_SESSIONS,
     )
 
 
+@app.get("/health/live", tags=["System"])
+async def liveness_check():
+    """Liveness probe: the process is up and its event loop responds."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", response_model=ReadinessResponse, tags=["System"])
+async def readiness_check(response: Response):
+    """Readiness probe: 503 while warming up, draining, without a renderer or without a free slot."""
+    reasons = not_ready_reasons()
+    if reasons:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return ReadinessResponse(
+        ready=not reasons,
+        reasons=reasons,
+        active_instances=get_active_instances(),
+        max_instances=settings.MAX_INSTANCES,
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+async def get_metrics():
+    """Metrics in Prometheus text format (no auth required)."""
+    metrics.set("active_instances", "Browser instances currently rendering", get_active_instances())
+    metrics.set("max_instances", "Maximum concurrent browser instances", settings.MAX_INSTANCES)
+    metrics.set("active_sessions", "Multi-step sessions currently open", get_active_sessions())
+    return metrics.render()
+
+
 # Rendering endpoints
 @app.post("/render", response_model=RenderResponse, tags=["Rendering"])
 async def render_page(
@@ -49,7 +188,7 @@ async def render_page(
 ):
     """Render a page and return HTML content."""
     try:
-        result = await run_renderer(
+        result = await render_with_retries(
             url=request.url,
             wait=request.wait,
             profile=request.profile,
@@ -59,10 +198,11 @@ async def render_page(
             exec_js=request.exec_js,
             post_js=request.post_js,
         )
-        return RenderResponse(
-            success=True,
-            html=result.get("html"),
-            current_url=result.get("current_url"),
+    except ServiceUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
         )
     except ConcurrencyLimitError as e:
         raise HTTPException(
@@ -72,6 +212,51 @@ async def render_page(
     except RendererError as e:
         return RenderResponse(success=False, error=str(e))
 
+    html = result.get("html")
+    current_url = result.get("current_url")
+    extracted = None
+    changes = {}
+
+    if request.track_changes or request.if_changed_since:
+        key = request_key(
+            request.url,
+            request.model_dump(
+                exclude={"url", "extract", "track_changes", "if_changed_since", "change_tolerance"}
+            ),
+        )
+        try:
+            changes = await detect_changes(
+                key, html, request.if_changed_since, request.change_tolerance
+            )
+        except ExtractionError as e:
+            return RenderResponse(success=False, current_url=current_url, error=str(e))
+        if changes["not_modified"]:
+            return RenderResponse(success=True, current_url=current_url, **changes)
+
+    if request.extract:
+        try:
+            extracted = await run_extraction(
+                html,
+                current_url or request.url,
+                request.extract.model_dump(exclude={"include_html"}),
+            )
+        except ExtractionError as e:
+            return RenderResponse(success=False, current_url=current_url, error=str(e))
+        if not request.extract.include_html:
+            html = None
+
+    if changes.get("diff") is not None:
+        html = None
+
+    return RenderResponse(
+        success=True,
+        html=html,
+        current_url=current_url,
+        extracted=ExtractResult(**extracted) if extracted is not None else None,
+        timings=result.get("timings"),
+        **changes,
+    )
+
 
 @app.post("/screenshot", tags=["Rendering"])
 async def take_screenshot(
@@ -80,7 +265,7 @@ async def take_screenshot(
 ):
     """Render a page and return a PNG screenshot."""
     try:
-        result = await run_renderer(
+        result = await render_with_retries(
             url=request.url,
             wait=request.wait,
             profile=request.profile,
@@ -97,6 +282,12 @@ async def take_screenshot(
             content=result["screenshot_data"],
             media_type="image/png",
         )
+    except ServiceUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
     except ConcurrencyLimitError as e:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -116,7 +307,7 @@ async def capture_network(
 ):
     """Render a page and return network requests."""
     try:
-        result = await run_renderer(
+        result = await render_with_retries(
             url=request.url,
             wait=request.wait,
             profile=request.profile,
@@ -132,6 +323,12 @@ async def capture_network(
             requests=result.get("network_data"),
             current_url=result.get("current_url"),
         )
+    except ServiceUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
     except ConcurrencyLimitError as e:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -141,15 +338,101 @@ async def capture_network(
         return NetworkResponse(success=False, error=str(e))
 
 
+async def _wait_for_disconnect(http_request: Request) -> None:
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _run_step(
+    http_request: Request, session: RendererSession, index: int, step: SessionStep
+) -> Optional[SessionStepResult]:
+    """Run a session step, cancelling it and returning None if the client disconnects first."""
+    task = asyncio.ensure_future(session.run_step(index, step))
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        task.cancel()
+    return task.result() if task.done() else None
+
+
+@app.post("/session", tags=["Rendering"])
+async def run_session(
+    request: SessionRequest,
+    http_request: Request,
+    _: str = Depends(verify_api_key),
+):
+    """Run a sequence of steps in one browser, streaming one JSON result per line."""
+    if not settings.SESSIONS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Sessions are disabled; they need a renderer supporting --session (SESSIONS_ENABLED)",
+        )
+    try:
+        check_session_admission()
+    except ServiceUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except ConcurrencyLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+        )
+
+    async def results():
+        # The slot is taken only once the stream runs, so a response that is
+        # never sent cannot hold it
+        try:
+            session = RendererSession(request)
+        except RendererError as e:
+            yield SessionStepResult(index=0, success=False, error=str(e)).model_dump_json() + "\n"
+            return
+        try:
+            try:
+                await session.start()
+            except RendererError as e:
+                yield SessionStepResult(index=0, success=False, error=str(e)).model_dump_json() + "\n"
+                return
+            for index, step in enumerate(request.steps):
+                result = await _run_step(http_request, session, index, step)
+                if result is None:
+                    return
+                yield result.model_dump_json() + "\n"
+                if not result.success:
+                    break
+        finally:
+            await session.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+# Admin endpoints
+@app.get("/admin/breakers", response_model=BreakerListResponse, tags=["Admin"])
+async def list_breakers(_: str = Depends(verify_api_key)):
+    """List circuit breaker state per host."""
+    return BreakerListResponse(breakers=[BreakerInfo(**b) for b in breakers.all()])
+
+
+@app.delete("/admin/breakers/{host}", tags=["Admin"])
+async def reset_breaker(host: str, _: str = Depends(verify_api_key)):
+    """Reset a host's circuit breaker to closed."""
+    if not breakers.reset(host):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No circuit breaker for '{host}'",
+        )
+    return {"success": True, "message": f"Circuit breaker for '{host}' reset"}
+
+
 # Profile endpoints
 @app.get("/profiles", response_model=ProfileListResponse, tags=["Profiles"])
 async def list_profiles(_: str = Depends(verify_api_key)):
     """List all saved profiles."""
-    profiles = []
-    if settings.PROFILES_DIR.exists():
-        for item in settings.PROFILES_DIR.iterdir():
-            if item.is_dir():
-                profiles.append(item.name)
+    profiles = await run_fs(list_subdirectories, settings.PROFILES_DIR)
     return ProfileListResponse(profiles=sorted(profiles))
 
 
@@ -161,15 +444,15 @@ async def create_profile(
     """Create a new empty profile."""
     profile_path = settings.PROFILES_DIR / request.name
 
-    if profile_path.exists():
+    if await run_fs(profile_path.exists):
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Profile '{request.name}' already exists",
         )
 
     try:
-        settings.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
-        profile_path.mkdir()
+        await run_fs(settings.PROFILES_DIR.mkdir, parents=True, exist_ok=True)
+        await run_fs(profile_path.mkdir)
         return ProfileCreateResponse(
             success=True,
             name=request.name,
@@ -187,7 +470,7 @@ async def get_profile(name: str, _: str = Depends(verify_api_key)):
     """Get profile information."""
     profile_path = settings.PROFILES_DIR / name
 
-    if not profile_path.exists():
+    if not await run_fs(profile_path.exists):
         return ProfileInfo(
             name=name,
             path=str(profile_path),
@@ -195,15 +478,12 @@ async def get_profile(name: str, _: str = Depends(verify_api_key)):
         )
 
     # Calculate total size
-    total_size = 0
-    for item in profile_path.rglob("*"):
-        if item.is_file():
-            total_size += item.stat().st_size
+    total_size = await run_fs(directory_size, profile_path)
 
     # Get last modified time
     last_modified = None
     try:
-        stat = profile_path.stat()
+        stat = await run_fs(profile_path.stat)
         last_modified = datetime.fromtimestamp(stat.st_mtime).isoformat()
     except:
         pass
@@ -222,14 +502,14 @@ async def delete_profile(name: str, _: str = Depends(verify_api_key)):
     """Delete a profile."""
     profile_path = settings.PROFILES_DIR / name
 
-    if not profile_path.exists():
+    if not await run_fs(profile_path.exists):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Profile '{name}' not found",
         )
 
     try:
-        shutil.rmtree(profile_path)
+        await run_fs(shutil.rmtree, profile_path)
         return {"success": True, "message": f"Profile '{name}' deleted"}
     except Exception as e:
         raise HTTPException(
@@ -238,6 +518,99 @@ async def delete_profile(name: str, _: str = Depends(verify_api_key)):
         )
 
 
+# Schedule endpoints
+def get_schedule_store() -> ScheduleStore:
+    if schedule_store is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Scheduler is disabled",
+        )
+    return schedule_store
+
+
+@app.get("/schedules", response_model=ScheduleListResponse, tags=["Schedules"])
+async def list_schedules(_: str = Depends(verify_api_key)):
+    """List all recurring render schedules."""
+    store = get_schedule_store()
+    schedules = await run_fs(store.all)
+    return ScheduleListResponse(schedules=[ScheduleInfo(**s) for s in schedules])
+
+
+@app.post("/schedules", response_model=ScheduleInfo, tags=["Schedules"])
+async def create_schedule(
+    request: ScheduleCreateRequest,
+    _: str = Depends(verify_api_key),
+):
+    """Register a recurring render or screenshot."""
+    store = get_schedule_store()
+    schedule = await run_fs(
+        store.create, request.kind, request.request, request.interval, request.jitter
+    )
+    scheduler.wakeup()
+    return ScheduleInfo(**schedule)
+
+
+@app.get("/schedules/{schedule_id}", response_model=ScheduleInfo, tags=["Schedules"])
+async def get_schedule(schedule_id: str, _: str = Depends(verify_api_key)):
+    """Get a schedule."""
+    store = get_schedule_store()
+    schedule = await run_fs(store.get, schedule_id)
+    if schedule is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Schedule '{schedule_id}' not found",
+        )
+    return ScheduleInfo(**schedule)
+
+
+@app.delete("/schedules/{schedule_id}", tags=["Schedules"])
+async def delete_schedule(schedule_id: str, _: str = Depends(verify_api_key)):
+    """Delete a schedule and its result history."""
+    store = get_schedule_store()
+    if not await run_fs(store.delete, schedule_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Schedule '{schedule_id}' not found",
+        )
+    return {"success": True, "message": f"Schedule '{schedule_id}' deleted"}
+
+
+@app.get("/schedules/{schedule_id}/results", response_model=ScheduleResultsResponse, tags=["Schedules"])
+async def get_schedule_results(
+    schedule_id: str,
+    limit: int = Query(default=20, ge=1, le=1000),
+    _: str = Depends(verify_api_key),
+):
+    """Get the most recent results of a schedule, newest first."""
+    store = get_schedule_store()
+    if await run_fs(store.get, schedule_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Schedule '{schedule_id}' not found",
+        )
+    results = await run_fs(store.results, schedule_id, limit)
+    return ScheduleResultsResponse(results=[
+        ScheduleResult(has_screenshot=r.pop("has_content"), **r) for r in results
+    ])
+
+
+@app.get("/schedules/{schedule_id}/results/{result_id}/screenshot", tags=["Schedules"])
+async def get_schedule_screenshot(
+    schedule_id: str,
+    result_id: int,
+    _: str = Depends(verify_api_key),
+):
+    """Get the PNG captured by a scheduled screenshot run."""
+    store = get_schedule_store()
+    content = await run_fs(store.result_content, schedule_id, result_id)
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No screenshot for result {result_id} of schedule '{schedule_id}'",
+        )
+    return Response(content=content, media_type="image/png")
+
+
 if __name__ == "__main__":
     import uvicorn
 
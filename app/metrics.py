@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Optional
+
+# Seconds between event loop lag samples
+_LAG_SAMPLE_INTERVAL = 0.5
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Minimal registry of counters and gauges rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: dict[str, dict] = {}
+
+    def _metric(self, name: str, kind: str, help: str) -> dict:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = {"type": kind, "help": help, "values": {}}
+        return metric
+
+    def inc(self, name: str, help: str, value: float = 1, labels: Optional[dict] = None) -> None:
+        values = self._metric(name, "counter", help)["values"]
+        key = tuple(sorted((labels or {}).items()))
+        values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, help: str, value: float, labels: Optional[dict] = None) -> None:
+        values = self._metric(name, "gauge", help)["values"]
+        values[tuple(sorted((labels or {}).items()))] = value
+
+    def remove(self, name: str, labels: Optional[dict] = None) -> None:
+        metric = self._metrics.get(name)
+        if metric is not None:
+            metric["values"].pop(tuple(sorted((labels or {}).items())), None)
+
+    def get(self, name: str, labels: Optional[dict] = None) -> float:
+        metric = self._metrics.get(name)
+        if metric is None:
+            return 0
+        return metric["values"].get(tuple(sorted((labels or {}).items())), 0)
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in sorted(metric["values"].items()):
+                label_str = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+async def monitor_loop_lag() -> None:
+    """Sample how late the event loop wakes up from a timed sleep."""
+    max_lag = 0.0
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(_LAG_SAMPLE_INTERVAL)
+        lag = max(time.perf_counter() - start - _LAG_SAMPLE_INTERVAL, 0.0)
+        max_lag = max(max_lag, lag)
+        metrics.set("event_loop_lag_seconds", "Event loop lag of the last sample", lag)
+        metrics.set("event_loop_lag_max_seconds", "Largest event loop lag since startup", max_lag)
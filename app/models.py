@@ -1,5 +1,7 @@
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+
+from .config import settings
 
 
 class TypeAction(BaseModel):
@@ -7,6 +9,34 @@ class TypeAction(BaseModel):
     value: str = Field(..., description="Value to type into the element")
 
 
+class ExtractOptions(BaseModel):
+    text: bool = Field(default=False, description="Extract readable main-content text")
+    markdown: bool = Field(default=False, description="Convert main content to Markdown")
+    links: bool = Field(default=False, description="List links resolved against the final URL")
+    css: Optional[list[str]] = Field(
+        default=None, description="CSS selectors whose matches should be returned"
+    )
+    xpath: Optional[list[str]] = Field(
+        default=None, description="XPath expressions whose matches should be returned"
+    )
+    include_html: bool = Field(
+        default=True, description="Also return the full rendered HTML"
+    )
+
+
+class ExtractedLink(BaseModel):
+    url: str
+    text: str
+
+
+class ExtractResult(BaseModel):
+    text: Optional[str] = None
+    markdown: Optional[str] = None
+    links: Optional[list[ExtractedLink]] = None
+    css: Optional[dict[str, list[str]]] = None
+    xpath: Optional[dict[str, list[str]]] = None
+
+
 class RenderRequest(BaseModel):
     url: str = Field(..., description="URL to render")
     wait: int = Field(default=5, ge=0, le=60, description="Seconds to wait for page load")
@@ -26,12 +56,31 @@ class RenderRequest(BaseModel):
     post_js: Optional[str] = Field(
         default=None, description="JavaScript to execute after actions"
     )
+    extract: Optional[ExtractOptions] = Field(
+        default=None, description="Server-side extraction to run on the rendered HTML"
+    )
+    track_changes: bool = Field(
+        default=False, description="Store and return a fingerprint of the rendered page"
+    )
+    if_changed_since: Optional[str] = Field(
+        default=None,
+        description="Fingerprint from a previous render; unchanged pages return only a not-modified marker",
+    )
+    change_tolerance: int = Field(
+        default=0, ge=0, le=64,
+        description="Max simhash bit distance of page text still treated as unchanged",
+    )
 
 
 class RenderResponse(BaseModel):
     success: bool
     html: Optional[str] = None
     current_url: Optional[str] = None
+    extracted: Optional[ExtractResult] = None
+    fingerprint: Optional[str] = None
+    not_modified: bool = False
+    diff: Optional[list[str]] = None
+    timings: Optional[dict[str, float]] = None
     error: Optional[str] = None
 
 
@@ -79,6 +128,54 @@ class NetworkRequest(BaseModel):
     )
 
 
+class SessionStep(BaseModel):
+    url: Optional[str] = Field(default=None, description="URL to navigate to; omit to stay on the current page")
+    wait: int = Field(default=0, ge=0, le=60, description="Seconds to wait after navigation")
+    type_actions: Optional[list[TypeAction]] = Field(
+        default=None, description="List of type actions to perform"
+    )
+    click_actions: Optional[list[str]] = Field(
+        default=None, description="List of CSS selectors to click"
+    )
+    wait_for: Optional[str] = Field(
+        default=None, description="CSS selector to wait for before capturing"
+    )
+    post_wait: Optional[int] = Field(
+        default=None, ge=0, le=120, description="Seconds to wait after actions"
+    )
+    post_js: Optional[str] = Field(
+        default=None, description="JavaScript to execute after actions"
+    )
+    capture: list[Literal["html", "screenshot", "network"]] = Field(
+        default=["html"], description="What to return for this step"
+    )
+
+
+class SessionRequest(BaseModel):
+    steps: list[SessionStep] = Field(..., min_length=1, max_length=100, description="Steps to run in order")
+    profile: Optional[str] = Field(default=None, description="Profile name for session persistence")
+    exec_js: Optional[str] = Field(
+        default=None, description="JavaScript to execute before each page load"
+    )
+    width: int = Field(default=1280, ge=320, le=3840, description="Viewport width")
+    height: int = Field(default=900, ge=240, le=2160, description="Viewport height")
+    idle_timeout: int = Field(
+        default=30, ge=1, le=300,
+        description="Seconds a step may take beyond its own waits before the session is closed",
+    )
+
+
+class SessionStepResult(BaseModel):
+    index: int
+    success: bool
+    html: Optional[str] = None
+    current_url: Optional[str] = None
+    screenshot: Optional[str] = Field(default=None, description="Base64-encoded PNG")
+    requests: Optional[list[dict]] = None
+    timings: Optional[dict[str, float]] = None
+    error: Optional[str] = None
+
+
 class NetworkResponse(BaseModel):
     success: bool
     requests: Optional[list[dict]] = None
@@ -108,8 +205,83 @@ class ProfileListResponse(BaseModel):
     profiles: list[str]
 
 
+class BreakerInfo(BaseModel):
+    host: str
+    state: str
+    requests: int
+    failures: int
+    retry_after: Optional[float] = None
+
+
+class BreakerListResponse(BaseModel):
+    breakers: list[BreakerInfo]
+
+
 class HealthResponse(BaseModel):
     status: str
     renderer_available: bool
     active_instances: int
     max_instances: int
+    active_sessions: int
+    max_sessions: int
+
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    reasons: list[str] = []
+    active_instances: int
+    max_instances: int
+
+
+class ScheduleCreateRequest(BaseModel):
+    kind: Literal["render", "screenshot"] = Field(..., description="Endpoint the schedule calls")
+    request: dict = Field(..., description="RenderRequest or ScreenshotRequest body, matching kind")
+    interval: int = Field(..., le=7 * 24 * 3600, description="Seconds between runs")
+    jitter: float = Field(
+        default=0.1, ge=0, le=1, description="Random delay per run, as a fraction of the interval"
+    )
+
+    @field_validator("interval")
+    @classmethod
+    def validate_interval(cls, value: int) -> int:
+        if value < settings.SCHEDULE_MIN_INTERVAL:
+            raise ValueError(f"interval must be at least {settings.SCHEDULE_MIN_INTERVAL} seconds")
+        return value
+
+    @model_validator(mode="after")
+    def validate_request(self):
+        model = RenderRequest if self.kind == "render" else ScreenshotRequest
+        try:
+            self.request = model(**self.request).model_dump(exclude_none=True)
+        except ValidationError as e:
+            raise ValueError(f"Invalid {self.kind} request: {e}")
+        return self
+
+
+class ScheduleInfo(BaseModel):
+    id: str
+    kind: str
+    request: dict
+    interval: int
+    jitter: float
+    created_at: str
+    next_run: str
+    last_run: Optional[str] = None
+
+
+class ScheduleListResponse(BaseModel):
+    schedules: list[ScheduleInfo]
+
+
+class ScheduleResult(BaseModel):
+    id: int
+    started_at: str
+    duration: float
+    success: bool
+    error: Optional[str] = None
+    response: Optional[dict] = None
+    has_screenshot: bool = False
+
+
+class ScheduleResultsResponse(BaseModel):
+    results: list[ScheduleResult]
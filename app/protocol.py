@@ -0,0 +1,192 @@
+"""Parsing of js-web-renderer output.
+
+The renderer either writes the legacy text format (an optional
+``CURRENT_URL:`` line followed by HTML, or one URL per line in network
+mode) or, when started with ``--framed-output``, a framed binary stream:
+
+    magic    b"JWRF" + 1-byte protocol version
+    frames   1-byte type + 4-byte big-endian payload length + payload
+
+Frame types:
+
+    M  metadata JSON object (``current_url`` and other page properties)
+    H  HTML body, UTF-8 (may be split across several frames)
+    S  screenshot PNG bytes (may be split across several frames)
+    N  one network record as a JSON object
+    T  timings JSON object (phase name -> seconds)
+    X  error message, UTF-8
+    E  end of output
+
+Framed output is parsed incrementally as it streams, so large bodies are not
+decoded and split as a whole.
+
+In session mode (``--session``) the renderer keeps the browser open and reads
+one JSON step per line on stdin; after the preamble, each step's output is a
+sequence of frames closed by its own ``E`` frame.
+"""
+import asyncio
+import json
+import struct
+from typing import Optional
+
+MAGIC = b"JWRF"
+VERSION = 1
+_PREAMBLE_SIZE = len(MAGIC) + 1
+_HEADER = struct.Struct(">cI")
+# Upper bound on a single frame's payload
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+_READ_SIZE = 64 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class TruncatedOutputError(ProtocolError):
+    """Output ended before the end frame, usually because the renderer died."""
+
+
+class FrameReader:
+    """Incremental parser for the framed output protocol."""
+
+    def __init__(self, preamble: bool = True):
+        self._buffer = bytearray()
+        # Readers for later outputs on the same stream skip the preamble
+        self.version: Optional[int] = None if preamble else VERSION
+        self.finished = False
+        self.metadata: dict = {}
+        self.timings: dict = {}
+        self.network: list[dict] = []
+        self.error: Optional[str] = None
+        self._html = bytearray()
+        self._screenshot = bytearray()
+        self._has_html = False
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+        if self.finished:
+            return
+
+        if self.version is None:
+            if len(self._buffer) < _PREAMBLE_SIZE:
+                return
+            if self._buffer[:len(MAGIC)] != MAGIC:
+                raise ProtocolError("Missing framed output magic")
+            self.version = self._buffer[len(MAGIC)]
+            if self.version != VERSION:
+                raise ProtocolError(f"Unsupported framed output version {self.version}")
+            del self._buffer[:_PREAMBLE_SIZE]
+
+        while not self.finished and len(self._buffer) >= _HEADER.size:
+            frame_type, length = _HEADER.unpack_from(self._buffer)
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame of {length} bytes exceeds limit")
+            if len(self._buffer) < _HEADER.size + length:
+                return
+            payload = bytes(self._buffer[_HEADER.size:_HEADER.size + length])
+            del self._buffer[:_HEADER.size + length]
+            self._handle(frame_type, payload)
+
+    def _handle(self, frame_type: bytes, payload: bytes) -> None:
+        try:
+            if frame_type == b"M":
+                self.metadata.update(json.loads(payload))
+            elif frame_type == b"H":
+                self._has_html = True
+                self._html += payload
+            elif frame_type == b"S":
+                self._screenshot += payload
+            elif frame_type == b"N":
+                self.network.append(json.loads(payload))
+            elif frame_type == b"T":
+                self.timings.update(json.loads(payload))
+            elif frame_type == b"X":
+                self.error = payload.decode(errors="replace")
+            elif frame_type == b"E":
+                self.finished = True
+            # Unknown frame types are skipped so newer renderers stay compatible
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ProtocolError(f"Malformed {frame_type.decode(errors='replace')} frame: {e}")
+
+    @property
+    def remainder(self) -> bytes:
+        """Bytes received after the end frame."""
+        return bytes(self._buffer) if self.finished else b""
+
+    def result(self, network: bool = False) -> dict:
+        if not self.finished:
+            raise TruncatedOutputError("Renderer output ended without end frame")
+        result = {
+            "success": True,
+            "html": self._html.decode(errors="replace") if self._has_html else None,
+            "current_url": self.metadata.get("current_url"),
+            "timings": self.timings or None,
+        }
+        if network:
+            result["network_data"] = self.network
+        if self._screenshot:
+            result["screenshot_data"] = bytes(self._screenshot)
+        return result
+
+
+def parse_text_output(output: str, network: bool = False, screenshot: bool = False) -> dict:
+    """Parse the legacy text output format."""
+    result = {
+        "success": True,
+        "html": None,
+        "current_url": None,
+    }
+
+    # Handle network output (--only-network returns network requests as text)
+    if network:
+        # Parse network log output - each line is a request URL
+        requests = []
+        for line in output.strip().split("\n"):
+            line = line.strip()
+            if line:
+                requests.append({"url": line})
+        result["network_data"] = requests
+    elif screenshot:
+        # Screenshot mode - no HTML output
+        pass
+    else:
+        # Normal HTML output
+        if output.startswith("CURRENT_URL:"):
+            lines = output.split("\n", 1)
+            result["current_url"] = lines[0].replace("CURRENT_URL:", "").strip()
+            result["html"] = lines[1] if len(lines) > 1 else ""
+        else:
+            result["html"] = output
+
+    return result
+
+
+async def read_output(
+    stream: asyncio.StreamReader,
+    network: bool = False,
+    screenshot: bool = False,
+) -> dict:
+    """Read renderer stdout to EOF, detecting framed or legacy text output."""
+    head = b""
+    while len(head) < _PREAMBLE_SIZE:
+        chunk = await stream.read(_PREAMBLE_SIZE - len(head))
+        if not chunk:
+            break
+        head += chunk
+
+    if not head.startswith(MAGIC):
+        # Legacy text output
+        chunks = [head]
+        while chunk := await stream.read(_READ_SIZE):
+            chunks.append(chunk)
+        return parse_text_output(b"".join(chunks).decode(), network, screenshot)
+
+    reader = FrameReader()
+    reader.feed(head)
+    while chunk := await stream.read(_READ_SIZE):
+        reader.feed(chunk)
+    if reader.remainder.strip():
+        raise ProtocolError("Data after end frame")
+    if reader.error is not None:
+        return {"success": False, "error": reader.error}
+    return reader.result(network)
@@ -0,0 +1,790 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import ssl
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Collection, Optional
+from urllib.parse import urlsplit
+
+from .fs import run_fs
+from .metrics import metrics
+from .tls import CertificateAuthority
+
+_MAX_HEADER_BYTES = 64 * 1024
+_READ_SIZE = 64 * 1024
+_CONNECT_TIMEOUT = 30
+# Seconds an idle client connection is kept open for its next request
+_KEEPALIVE_TIMEOUT = 60
+# Idle upstream connections kept for reuse, per origin and in total
+_MAX_IDLE_PER_ORIGIN = 6
+_MAX_IDLE = 100
+# Seconds an idle upstream connection is kept before it is closed
+_UPSTREAM_IDLE_TIMEOUT = 30
+# Only these are sent on a reused upstream connection, since they can be
+# resent when the origin closed it while idle
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Headers that apply to a single connection and are never forwarded or stored
+_HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade",
+}
+_CACHEABLE_STATUS = {200, 203, 301, 308}
+_STATIC_TYPES = ("text/css", "javascript", "font/", "image/", "application/font", "application/wasm")
+_STATIC_EXTENSIONS = (
+    ".js", ".mjs", ".css", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".svg", ".ico", ".wasm",
+)
+# Cap on the heuristic freshness derived from Last-Modified
+_MAX_HEURISTIC_LIFETIME = 24 * 3600
+
+
+def _parse_cache_control(value: Optional[str]) -> dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers: list[tuple[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_static_asset(url: str, headers: list[tuple[str, str]]) -> bool:
+    content_type = (_header(headers, "content-type") or "").lower()
+    if any(t in content_type for t in _STATIC_TYPES):
+        return True
+    return urlsplit(url).path.lower().endswith(_STATIC_EXTENSIONS)
+
+
+def freshness_lifetime(
+    url: str,
+    status: int,
+    headers: list[tuple[str, str]],
+    now: float,
+    static_ttl: int = 0,
+    request_has_cookie: bool = False,
+) -> Optional[float]:
+    """Seconds a response may be served from cache, or None if it must not be stored.
+
+    Follows the shared-cache rules of RFC 9111, with ``static_ttl`` as a minimum
+    lifetime for static asset types that do not forbid caching.
+    """
+    if status not in _CACHEABLE_STATUS:
+        return None
+    cc = _parse_cache_control(_header(headers, "cache-control"))
+    if "no-store" in cc or "private" in cc:
+        return None
+    if _header(headers, "set-cookie") is not None:
+        return None
+    vary = {v.strip().lower() for v in (_header(headers, "vary") or "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return None
+
+    static = is_static_asset(url, headers)
+    # Responses to cookie-bearing requests may be personalised; only share
+    # them across profiles when explicitly public or a static asset.
+    if request_has_cookie and "public" not in cc and not static:
+        return None
+
+    lifetime = 0.0
+    if "no-cache" in cc:
+        return 0.0
+    if "s-maxage" in cc or "max-age" in cc:
+        try:
+            lifetime = float(cc.get("s-maxage") or cc.get("max-age") or 0)
+        except ValueError:
+            lifetime = 0.0
+    else:
+        date = _parse_date(_header(headers, "date")) or now
+        expires = _parse_date(_header(headers, "expires"))
+        last_modified = _parse_date(_header(headers, "last-modified"))
+        if expires is not None:
+            lifetime = expires - date
+        elif last_modified is not None:
+            lifetime = min((date - last_modified) * 0.1, _MAX_HEURISTIC_LIFETIME)
+
+    if static and static_ttl and "must-revalidate" not in cc:
+        lifetime = max(lifetime, static_ttl)
+    return max(lifetime, 0.0)
+
+
+class DiskCache:
+    """Size-bounded on-disk response store with LRU eviction.
+
+    The index lives in memory and is only touched from the event loop; file
+    reads and writes run in the filesystem thread pool.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index: OrderedDict[str, dict] = OrderedDict()
+
+    @staticmethod
+    def key(url: str, accept_encoding: Optional[str]) -> str:
+        return hashlib.sha256(f"{url}\n{accept_encoding or ''}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _load(self) -> list[tuple[float, str, dict]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if "." in path.name:
+                # Partial write interrupted by a crash
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                with open(path, "rb") as f:
+                    meta = json.loads(f.read(int.from_bytes(f.read(4), "big")))
+                entries.append((path.stat().st_atime, path.name, meta))
+            except (OSError, ValueError):
+                path.unlink(missing_ok=True)
+        return sorted(entries)
+
+    async def load(self) -> None:
+        """Rebuild the index from entries left on disk by a previous run."""
+        for _, key, meta in await run_fs(self._load):
+            self._index[key] = meta
+            self.size += meta["size"]
+        await self._evict()
+
+    def get(self, key: str) -> Optional[dict]:
+        meta = self._index.get(key)
+        if meta is not None:
+            self._index.move_to_end(key)
+        return meta
+
+    def _read_body(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            f.seek(4 + int.from_bytes(f.read(4), "big"))
+            return f.read()
+
+    async def read_body(self, key: str) -> Optional[bytes]:
+        try:
+            return await run_fs(self._read_body, key)
+        except OSError:
+            self._drop(key)
+            return None
+
+    def _write(self, key: str, meta: dict, body: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        header = json.dumps(meta).encode()
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(len(header).to_bytes(4, "big"))
+            f.write(header)
+            f.write(body)
+        tmp.replace(path)
+
+    async def put(self, key: str, meta: dict, body: bytes) -> None:
+        meta = {**meta, "size": len(body)}
+        if meta["size"] > self.max_bytes:
+            return
+        await run_fs(self._write, key, meta, body)
+        self._drop(key)
+        self._index[key] = meta
+        self.size += meta["size"]
+        await self._evict()
+
+    async def update(self, key: str, meta: dict) -> None:
+        """Replace an entry's metadata, e.g. after a successful revalidation."""
+        body = await self.read_body(key)
+        if body is not None:
+            await self.put(key, meta, body)
+
+    def _drop(self, key: str) -> None:
+        meta = self._index.pop(key, None)
+        if meta is not None:
+            self.size -= meta["size"]
+
+    async def _evict(self) -> None:
+        evicted = []
+        while self.size > self.max_bytes and self._index:
+            key, meta = self._index.popitem(last=False)
+            self.size -= meta["size"]
+            evicted.append(self._path(key))
+        if evicted:
+            metrics.inc("cache_proxy_evictions_total", "Cache entries evicted to stay within size", len(evicted))
+            await run_fs(lambda: [path.unlink(missing_ok=True) for path in evicted])
+        metrics.set("cache_proxy_size_bytes", "Bytes stored in the subresource cache", self.size)
+        metrics.set("cache_proxy_entries", "Entries in the subresource cache", len(self._index))
+
+
+class _BadRequest(Exception):
+    pass
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[str, list[tuple[str, str]]]:
+    try:
+        data = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            raise EOFError
+        raise _BadRequest("Incomplete message head")
+    except asyncio.LimitOverrunError:
+        raise _BadRequest("Message head too large")
+    lines = data.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise _BadRequest("Malformed header line")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def _connection_tokens(headers: list[tuple[str, str]]) -> set[str]:
+    return {t.strip().lower() for t in (_header(headers, "connection") or "").split(",")}
+
+
+def _forwardable(headers: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    connection_tokens = _connection_tokens(headers)
+    return [
+        (k, v) for k, v in headers
+        if k.lower() not in _HOP_BY_HOP and k.lower() not in connection_tokens
+    ]
+
+
+def _serialize_head(first_line: str, headers: list[tuple[str, str]]) -> bytes:
+    lines = [first_line] + [f"{k}: {v}" for k, v in headers] + ["", ""]
+    return "\r\n".join(lines).encode("latin-1")
+
+
+def _split_authority(target: str) -> tuple[str, int]:
+    host, _, port = target.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+def _has_body(method: str, status: int) -> bool:
+    return method != "HEAD" and not 100 <= status < 200 and status not in (204, 304)
+
+
+async def _read_body(
+    reader: asyncio.StreamReader, length: Optional[int], chunked: bool
+) -> AsyncIterator[bytes]:
+    """Yield a message body framed by chunked encoding, Content-Length or connection close.
+
+    A body shorter than ``length`` ends early; callers compare sizes.
+    """
+    if chunked:
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+            if size == 0:
+                # Trailers are dropped
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return
+            while size:
+                data = await reader.readexactly(min(size, _READ_SIZE))
+                size -= len(data)
+                yield data
+            await reader.readexactly(2)
+    elif length is not None:
+        while length > 0:
+            data = await reader.read(min(length, _READ_SIZE))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+    else:
+        while data := await reader.read(_READ_SIZE):
+            yield data
+
+
+async def _send_request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: bytes
+) -> tuple[str, list[tuple[str, str]]]:
+    """Send a request and read the final response head."""
+    writer.write(request)
+    await writer.drain()
+    while True:
+        status_line, headers = await _read_head(reader)
+        # Interim responses such as 103 Early Hints are dropped
+        if not 100 <= int((status_line.split(" ", 2) + [""])[1]) < 200:
+            return status_line, headers
+
+
+class _UpstreamPool:
+    """Idle keep-alive connections to origins, reused by later requests."""
+
+    def __init__(self):
+        self._idle: dict[tuple, list[tuple[float, asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._count = 0
+
+    def get(self, origin: tuple) -> Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+        connections = self._idle.get(origin)
+        now = time.monotonic()
+        while connections:
+            released_at, reader, writer = connections.pop()
+            self._count -= 1
+            if now - released_at < _UPSTREAM_IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        self._idle.pop(origin, None)
+        return None
+
+    def put(self, origin: tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections = self._idle.setdefault(origin, [])
+        connections.append((time.monotonic(), reader, writer))
+        self._count += 1
+        if len(connections) > _MAX_IDLE_PER_ORIGIN:
+            self._close_oldest(origin)
+        while self._count > _MAX_IDLE:
+            self._close_oldest(min(self._idle, key=lambda key: self._idle[key][0][0]))
+
+    def _close_oldest(self, origin: tuple) -> None:
+        connections = self._idle[origin]
+        connections.pop(0)[2].close()
+        self._count -= 1
+        if not connections:
+            del self._idle[origin]
+
+    def close(self) -> None:
+        for connections in self._idle.values():
+            for _, _, writer in connections:
+                writer.close()
+        self._idle.clear()
+        self._count = 0
+
+
+async def _pipe(src: asyncio.StreamReader, dst: asyncio.StreamWriter) -> None:
+    try:
+        while data := await src.read(_READ_SIZE):
+            dst.write(data)
+            await dst.drain()
+    except ConnectionError:
+        pass
+    finally:
+        dst.close()
+
+
+class CacheProxy:
+    """Local forward HTTP proxy shared by all renderer processes.
+
+    Responses are cached according to HTTP cache semantics. With a
+    certificate authority, HTTPS requested through CONNECT to one of
+    ``intercept_ports`` is intercepted: the renderer's TLS is terminated with
+    a certificate issued for the target host and requests are forwarded and
+    cached like plain HTTP. Other CONNECT targets, such as ws:// on port 80,
+    are tunnelled unchanged. Client connections are kept alive across
+    requests and upstream connections are reused per origin.
+    """
+
+    def __init__(
+        self,
+        cache: DiskCache,
+        static_ttl: int,
+        max_object_bytes: int,
+        ca: Optional[CertificateAuthority] = None,
+        upstream_context: Optional[ssl.SSLContext] = None,
+        intercept_ports: Collection[int] = (443,),
+    ):
+        self.cache = cache
+        self.static_ttl = static_ttl
+        self.max_object_bytes = max_object_bytes
+        self.ca = ca
+        self.upstream_context = upstream_context or ssl.create_default_context()
+        self.intercept_ports = intercept_ports
+        self._pool = _UpstreamPool()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._hits = 0
+        self._lookups = 0
+
+    async def start(self, host: str, port: int) -> None:
+        await self.cache.load()
+        self._server = await asyncio.start_server(
+            self._handle, host, port, limit=_MAX_HEADER_BYTES
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self._pool.close()
+
+    def _record(self, result: str, bytes_saved: int = 0) -> None:
+        metrics.inc("cache_proxy_requests_total", "Proxied requests by cache result", labels={"result": result})
+        if result in ("hit", "revalidated", "miss"):
+            self._lookups += 1
+            if result != "miss":
+                self._hits += 1
+            metrics.set("cache_proxy_hit_ratio", "Share of cacheable requests served from cache", self._hits / self._lookups)
+        if bytes_saved:
+            metrics.inc("cache_proxy_bytes_saved_total", "Response bytes served from cache instead of origin", bytes_saved)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line, headers = await _read_head(reader)
+            method, target, _ = request_line.split(" ", 2)
+            if method == "CONNECT":
+                host, port = _split_authority(target)
+                if self.ca is not None and port in self.intercept_ports:
+                    await self._intercept(host, port, reader, writer)
+                else:
+                    await self._tunnel(host, port, reader, writer)
+            else:
+                await self._serve(request_line, headers, reader, writer)
+        except (EOFError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except (_BadRequest, ValueError):
+            await self._error(writer, 400, "Bad Request")
+        except (OSError, asyncio.TimeoutError):
+            await self._error(writer, 502, "Bad Gateway")
+        finally:
+            writer.close()
+
+    async def _serve(
+        self,
+        request_line: str,
+        headers: list[tuple[str, str]],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        tunnel: Optional[tuple[str, int]] = None,
+    ) -> None:
+        """Answer requests on one client connection until either side closes it.
+
+        ``tunnel`` is the CONNECT target of an intercepted connection, whose
+        requests carry only a path.
+        """
+        while True:
+            method, target, version = request_line.split(" ", 2)
+            if tunnel is not None:
+                host, port = tunnel
+                if not target.startswith("/"):
+                    raise _BadRequest("Expected an origin-form request target")
+                if _header(headers, "upgrade"):
+                    await self._splice(host, port, request_line, headers, reader, writer)
+                    return
+                authority = f"[{host}]" if ":" in host else host
+                if port != 443:
+                    authority += f":{port}"
+                target = f"https://{authority}{target}"
+
+            keep_alive = version == "HTTP/1.1" and "close" not in _connection_tokens(headers)
+            if not await self._forward(method, target, headers, reader, writer, keep_alive):
+                return
+            try:
+                request_line, headers = await asyncio.wait_for(_read_head(reader), _KEEPALIVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+
+    async def _error(self, writer: asyncio.StreamWriter, status: int, reason: str) -> None:
+        try:
+            writer.write(_serialize_head(
+                f"HTTP/1.1 {status} {reason}",
+                [("Content-Length", "0"), ("Connection", "close")],
+            ))
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _tunnel(self, host: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream_reader, upstream_writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), _CONNECT_TIMEOUT
+        )
+        self._record("tunnel")
+        writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        await writer.drain()
+        await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+    async def _intercept(self, host: str, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Terminate TLS for a CONNECT target and serve the requests inside it."""
+        context = await self.ca.server_context(host)
+        writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        await writer.drain()
+        try:
+            await writer.start_tls(context)
+        except ssl.SSLError:
+            # Typically a renderer that does not trust the proxy CA
+            self._record("tls_error")
+            raise ConnectionResetError
+
+        request_line, headers = await _read_head(reader)
+        await self._serve(request_line, headers, reader, writer, tunnel=(host, port))
+
+    async def _splice(
+        self,
+        host: str,
+        port: int,
+        request_line: str,
+        headers: list[tuple[str, str]],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Pass WebSockets and other upgrades through to the origin uncached."""
+        upstream_reader, upstream_writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.upstream_context), _CONNECT_TIMEOUT
+        )
+        self._record("tunnel")
+        upstream_writer.write(_serialize_head(request_line, headers))
+        await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+    async def _forward(
+        self,
+        method: str,
+        url: str,
+        headers: list[tuple[str, str]],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        keep_alive: bool,
+    ) -> bool:
+        """Answer one request, returning whether the client connection stays open."""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise _BadRequest("Only absolute http:// and https:// URLs can be proxied")
+
+        body = b""
+        if _header(headers, "transfer-encoding"):
+            await self._error(writer, 411, "Length Required")
+            return False
+        length = _header(headers, "content-length")
+        if length:
+            body = await reader.readexactly(int(length))
+
+        request_cc = _parse_cache_control(_header(headers, "cache-control"))
+        cacheable_request = (
+            method == "GET"
+            and _header(headers, "authorization") is None
+            and _header(headers, "range") is None
+            and "no-store" not in request_cc
+        )
+
+        if not cacheable_request:
+            self._record("bypass")
+            return await self._relay(method, parts, headers, body, writer, keep_alive)
+
+        key = self.cache.key(url, _header(headers, "accept-encoding"))
+        entry = None if "no-cache" in request_cc else self.cache.get(key)
+        now = time.time()
+
+        if entry is not None and entry["expires_at"] > now:
+            cached_body = await self.cache.read_body(key)
+            if cached_body is not None:
+                self._record("hit", len(cached_body))
+                await self._send_cached(entry, cached_body, now, writer, keep_alive)
+                return keep_alive
+            entry = None
+
+        upstream_headers = list(headers)
+        if entry is not None:
+            upstream_headers = [
+                (k, v) for k, v in headers
+                if k.lower() not in ("if-none-match", "if-modified-since")
+            ]
+            if entry.get("etag"):
+                upstream_headers.append(("If-None-Match", entry["etag"]))
+            if entry.get("last_modified"):
+                upstream_headers.append(("If-Modified-Since", entry["last_modified"]))
+
+        return await self._relay(
+            method, parts, upstream_headers, body, writer, keep_alive,
+            cache_key=key, cached=entry,
+            has_cookie=_header(headers, "cookie") is not None,
+        )
+
+    async def _send_cached(
+        self, entry: dict, body: bytes, now: float, writer: asyncio.StreamWriter, keep_alive: bool
+    ) -> None:
+        response_headers = [
+            (k, v) for k, v in entry["headers"] if k.lower() not in ("age", "content-length")
+        ]
+        response_headers += [
+            ("Age", str(int(now - entry["stored_at"]))),
+            ("Content-Length", str(len(body))),
+        ]
+        if not keep_alive:
+            response_headers.append(("Connection", "close"))
+        writer.write(_serialize_head(f"HTTP/1.1 {entry['status']} {entry['reason']}", response_headers))
+        writer.write(body)
+        await writer.drain()
+
+    async def _connect(self, origin: tuple) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        scheme, host, port = origin
+        return await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port, limit=_MAX_HEADER_BYTES,
+                ssl=self.upstream_context if scheme == "https" else None,
+            ),
+            _CONNECT_TIMEOUT,
+        )
+
+    async def _exchange(
+        self, origin: tuple, method: str, request: bytes
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, str, list[tuple[str, str]]]:
+        """Send a request on a pooled or new upstream connection and read the response head."""
+        pooled = self._pool.get(origin) if method in _IDEMPOTENT_METHODS else None
+        if pooled is not None:
+            try:
+                response = await _send_request(*pooled, request)
+            except (EOFError, ConnectionError, asyncio.IncompleteReadError):
+                # Closed by the origin while idle; resend on a new connection
+                pooled[1].close()
+            else:
+                metrics.inc("cache_proxy_upstream_reused_total", "Upstream requests sent on a reused connection")
+                return (*pooled, *response)
+        upstream_reader, upstream_writer = await self._connect(origin)
+        try:
+            return upstream_reader, upstream_writer, *await _send_request(upstream_reader, upstream_writer, request)
+        except BaseException:
+            upstream_writer.close()
+            raise
+
+    async def _relay(
+        self,
+        method: str,
+        parts,
+        headers: list[tuple[str, str]],
+        body: bytes,
+        writer: asyncio.StreamWriter,
+        keep_alive: bool,
+        cache_key: Optional[str] = None,
+        cached: Optional[dict] = None,
+        has_cookie: bool = False,
+    ) -> bool:
+        """Send a request upstream and stream the response back, caching it if allowed.
+
+        Returns whether the client connection stays open.
+        """
+        https = parts.scheme == "https"
+        origin = (parts.scheme, parts.hostname, parts.port or (443 if https else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+        upstream_headers = [
+            (k, v) for k, v in _forwardable(headers) if k.lower() != "host"
+        ]
+        upstream_headers = [("Host", parts.netloc)] + upstream_headers
+        upstream_reader, upstream_writer, status_line, response_headers = await self._exchange(
+            origin, method, _serialize_head(f"{method} {path} HTTP/1.1", upstream_headers) + body
+        )
+        reusable = False
+        try:
+            version, status, reason = (status_line.split(" ", 2) + [""])[:3]
+            status = int(status)
+            upstream_keep_alive = version == "HTTP/1.1" and "close" not in _connection_tokens(response_headers)
+            now = time.time()
+            url = parts.geturl()
+
+            if cached is not None and status == 304:
+                # Revalidated: refresh the stored entry and serve it
+                cached_body = await self.cache.read_body(cache_key)
+                if cached_body is not None:
+                    reusable = upstream_keep_alive
+                    merged = {k.lower(): (k, v) for k, v in cached["headers"]}
+                    merged.update({k.lower(): (k, v) for k, v in _forwardable(response_headers)})
+                    refreshed_headers = list(merged.values())
+                    lifetime = freshness_lifetime(url, cached["status"], refreshed_headers, now, self.static_ttl, has_cookie)
+                    if lifetime is not None:
+                        await self.cache.update(cache_key, {
+                            **cached, "headers": refreshed_headers,
+                            "stored_at": now, "expires_at": now + lifetime,
+                        })
+                    self._record("revalidated", len(cached_body))
+                    await self._send_cached(
+                        {**cached, "headers": refreshed_headers, "stored_at": now}, cached_body, now, writer, keep_alive
+                    )
+                    return keep_alive
+
+            length = _header(response_headers, "content-length")
+            chunked = "chunked" in (_header(response_headers, "transfer-encoding") or "").lower()
+            if not _has_body(method, status):
+                body_length = 0
+            elif not chunked and length and length.isdigit():
+                body_length = int(length)
+            else:
+                body_length = None
+
+            lifetime = None
+            if cache_key is not None:
+                lifetime = freshness_lifetime(url, status, response_headers, now, self.static_ttl, has_cookie)
+                self._record("miss")
+                if body_length is not None and body_length > self.max_object_bytes:
+                    lifetime = None
+            store = lifetime is not None and (
+                lifetime > 0 or _header(response_headers, "etag") or _header(response_headers, "last-modified")
+            )
+
+            # Transfer-Encoding is hop-by-hop; a chunked body is chunked again
+            # for the client, or delimited by closing the connection
+            forwarded = _forwardable(response_headers)
+            if chunked:
+                forwarded = [(k, v) for k, v in forwarded if k.lower() != "content-length"]
+            rechunk = chunked and body_length is None and keep_alive
+            if rechunk:
+                forwarded.append(("Transfer-Encoding", "chunked"))
+            elif body_length is None:
+                keep_alive = False
+            if not keep_alive:
+                forwarded.append(("Connection", "close"))
+            writer.write(_serialize_head(f"HTTP/1.1 {status} {reason}", forwarded))
+
+            chunks = []
+            size = 0
+            async for data in _read_body(upstream_reader, body_length, chunked and body_length is None):
+                writer.write(b"%x\r\n%b\r\n" % (len(data), data) if rechunk else data)
+                await writer.drain()
+                size += len(data)
+                if store:
+                    if size > self.max_object_bytes:
+                        store = False
+                        chunks = []
+                    else:
+                        chunks.append(data)
+            if rechunk:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+
+            complete = body_length is None or size == body_length
+            if not complete:
+                # Upstream closed before the full body arrived
+                store = False
+                keep_alive = False
+            reusable = upstream_keep_alive and complete and (chunked or body_length is not None)
+
+            if store:
+                await self.cache.put(cache_key, {
+                    "url": url,
+                    "status": status,
+                    "reason": reason,
+                    "headers": _forwardable(response_headers),
+                    "stored_at": now,
+                    "expires_at": now + lifetime,
+                    "etag": _header(response_headers, "etag"),
+                    "last_modified": _header(response_headers, "last-modified"),
+                }, b"".join(chunks))
+            return keep_alive
+        finally:
+            if reusable:
+                self._pool.put(origin, upstream_reader, upstream_writer)
+            else:
+                upstream_writer.close()
@@ -1,12 +1,13 @@
 import asyncio
-import json
-import shlex
-import tempfile
-from pathlib import Path
+import os
+import signal
 from typing import Optional
 
 from .config import settings
+from .fs import run_fs, workspace
 from .models import TypeAction
+from .protocol import ProtocolError, TruncatedOutputError, read_output
+from .tls import CertificateAuthority
 
 
 class RendererError(Exception):
@@ -17,7 +18,135 @@ class ConcurrencyLimitError(RendererError):
     pass
 
 
+class RendererTimeoutError(RendererError):
+    pass
+
+
+class ServiceUnavailableError(RendererError):
+    """A render refused for now; worth retrying after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DrainingError(ServiceUnavailableError):
+    pass
+
+
+# Retry-After for renders refused while draining; by then a restarted or
+# other instance should take them
+_DRAIN_RETRY_AFTER = 5
+
 _active_instances = 0
+_draining = False
+_processes: set[asyncio.subprocess.Process] = set()
+_proxy_url: Optional[str] = None
+_proxy_ca: Optional[CertificateAuthority] = None
+
+
+def start_draining() -> None:
+    """Refuse new renders and sessions from now on."""
+    global _draining
+    _draining = True
+
+
+def is_draining() -> bool:
+    return _draining
+
+
+def check_admission() -> None:
+    """Raise DrainingError if new renderer processes must not be started."""
+    if _draining:
+        raise DrainingError("Server is shutting down", _DRAIN_RETRY_AFTER)
+
+
+async def spawn_renderer(cmd: list[str], **kwargs) -> asyncio.subprocess.Process:
+    """Start a renderer process in its own process group, tracked for kill_renderers."""
+    global _processes
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        start_new_session=True,
+        env=renderer_env(),
+        **kwargs,
+    )
+    _processes = {p for p in _processes if p.returncode is None}
+    _processes.add(process)
+    return process
+
+
+def kill_process_group(process: asyncio.subprocess.Process) -> None:
+    """Kill a renderer process along with the browser processes it started."""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def kill_renderers() -> int:
+    """Kill every running renderer process group, returning how many were killed."""
+    running = [p for p in _processes if p.returncode is None]
+    for process in running:
+        kill_process_group(process)
+    return len(running)
+
+
+def set_proxy_url(url: Optional[str], ca: Optional[CertificateAuthority] = None) -> None:
+    """Route renderer traffic through a proxy, or directly when None.
+
+    HTTPS only goes through the proxy when it intercepts TLS with ``ca``;
+    a plain tunnel would add a hop without caching anything.
+    """
+    global _proxy_url, _proxy_ca
+    _proxy_url = url
+    _proxy_ca = ca
+
+
+def renderer_env() -> Optional[dict]:
+    if not _proxy_url:
+        return None
+    env = dict(os.environ)
+    names = ["HTTP_PROXY", "http_proxy"]
+    if _proxy_ca is not None:
+        names += ["HTTPS_PROXY", "https_proxy"]
+    for name in names:
+        env[name] = _proxy_url
+    return env
+
+
+def renderer_proxy_args() -> list[str]:
+    """Renderer flags to trust the proxy CA when HTTPS is intercepted."""
+    if not _proxy_url or _proxy_ca is None:
+        return []
+    return ["--proxy-ca", str(_proxy_ca.cert_path), "--proxy-ca-spki", _proxy_ca.spki_hash]
+
+
+async def _collect_output(
+    process: asyncio.subprocess.Process,
+    network: bool,
+    screenshot: bool,
+) -> tuple[dict, bytes]:
+    """Parse stdout as it streams while draining stderr, then wait for exit."""
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    try:
+        try:
+            result = await read_output(process.stdout, network, screenshot)
+        except TruncatedOutputError as e:
+            # A renderer that died mid-output is reported by its exit status
+            # and stderr, not by the truncation
+            stderr = await stderr_task
+            await process.wait()
+            if process.returncode == 0:
+                raise
+            return {"success": False, "error": str(e)}, stderr
+    except BaseException:
+        stderr_task.cancel()
+        raise
+    stderr = await stderr_task
+    await process.wait()
+    return result, stderr
 
 
 async def run_renderer(
@@ -37,6 +166,7 @@ async def run_renderer(
     """Run js-web-renderer and return results."""
     
     global _active_instances
+    check_admission()
     if _active_instances >= settings.MAX_INSTANCES:
         raise ConcurrencyLimitError(f"Too many concurrent render requests. Limit is {settings.MAX_INSTANCES}.")
         
@@ -70,96 +200,63 @@ async def run_renderer(
         if post_js:
             cmd.extend(["--post-js", post_js])
 
-        screenshot_file = None
+        async with workspace() as scratch:
+            screenshot_path = None
 
-        if screenshot:
-            screenshot_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-            screenshot_file.close()
-            cmd.extend([
-                "--screenshot", screenshot_file.name,
-                "--width", str(width),
-                "--height", str(height),
-                ])
+            if screenshot:
+                screenshot_path = scratch / "screenshot.png"
+                cmd.extend([
+                    "--screenshot", str(screenshot_path),
+                    "--width", str(width),
+                    "--height", str(height),
+                    ])
 
-        if network:
-            cmd.append("--only-network")
+            if network:
+                cmd.append("--only-network")
 
-        try:
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
+            if settings.RENDERER_FRAMED_OUTPUT:
+                cmd.append("--framed-output")
+
+            cmd.extend(renderer_proxy_args())
 
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=max(wait + (post_wait or 0) + 60, 120)
+                process = await spawn_renderer(
+                    cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=str(scratch),
                 )
-            except (asyncio.TimeoutError, asyncio.CancelledError):
-                if process.returncode is None:
-                    try:
-                        process.kill()
-                    except ProcessLookupError:
-                        pass
-                raise
 
-            if process.returncode != 0:
-                error_msg = stderr.decode().strip() or f"Renderer exited with code {process.returncode}"
-                raise RendererError(error_msg)
+                try:
+                    result, stderr = await asyncio.wait_for(
+                        _collect_output(process, network, screenshot),
+                        timeout=max(wait + (post_wait or 0) + 60, 120)
+                    )
+                except (asyncio.TimeoutError, asyncio.CancelledError, ProtocolError):
+                    kill_process_group(process)
+                    raise
 
-            output = stdout.decode()
+                if process.returncode != 0:
+                    error_msg = stderr.decode().strip() or f"Renderer exited with code {process.returncode}"
+                    raise RendererError(error_msg)
 
-            result = {
-                "success": True,
-                "html": None,
-                "current_url": None,
-            }
+                if not result["success"]:
+                    raise RendererError(result["error"])
 
-            # Handle network output (--only-network returns network requests as text)
-            if network:
-                # Parse network log output - each line is a request URL
-                requests = []
-                for line in output.strip().split("\n"):
-                    line = line.strip()
-                    if line:
-                        requests.append({"url": line})
-                result["network_data"] = requests
-            elif screenshot:
-                # Screenshot mode - no HTML output
-                pass
-            else:
-                # Normal HTML output
-                if output.startswith("CURRENT_URL:"):
-                    lines = output.split("\n", 1)
-                    result["current_url"] = lines[0].replace("CURRENT_URL:", "").strip()
-                    result["html"] = lines[1] if len(lines) > 1 else ""
-                else:
-                    result["html"] = output
-
-            if screenshot and screenshot_file:
-                screenshot_path = Path(screenshot_file.name)
-                if screenshot_path.exists():
-                    result["screenshot_data"] = screenshot_path.read_bytes()
-                    screenshot_path.unlink()
-                else:
-                    raise RendererError("Screenshot file was not created")
-
-            return result
-
-        except asyncio.TimeoutError:
-            raise RendererError("Renderer timed out")
-        except Exception as e:
-            if isinstance(e, RendererError):
-                raise
-            raise RendererError(str(e))
-        finally:
-            # Clean up temp files on error
-            if screenshot_file:
-                try:
-                    Path(screenshot_file.name).unlink(missing_ok=True)
-                except:
-                    pass
+                if screenshot_path and "screenshot_data" not in result:
+                    try:
+                        result["screenshot_data"] = await run_fs(screenshot_path.read_bytes)
+                    except FileNotFoundError:
+                        raise RendererError("Screenshot file was not created")
+
+                return result
+
+            except asyncio.TimeoutError:
+                raise RendererTimeoutError("Renderer timed out")
+            except Exception as e:
+                if isinstance(e, RendererError):
+                    raise
+                raise RendererError(str(e))
     finally:
         _active_instances -= 1
 
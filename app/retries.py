@@ -0,0 +1,169 @@
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+from .breaker import breakers
+from .config import settings
+from .metrics import metrics
+from .renderer import (
+    ConcurrencyLimitError,
+    RendererError,
+    RendererTimeoutError,
+    ServiceUnavailableError,
+    get_active_instances,
+    run_renderer,
+)
+
+# Successful render durations kept per host
+_SAMPLES_PER_HOST = 100
+# Hosts tracked before the least recently rendered is forgotten
+_MAX_HOSTS = 1000
+
+
+class LatencyTracker:
+    """Recent successful render durations per host."""
+
+    def __init__(self, samples_per_host: int = _SAMPLES_PER_HOST, max_hosts: int = _MAX_HOSTS):
+        self.samples_per_host = samples_per_host
+        self.max_hosts = max_hosts
+        self._hosts: OrderedDict[str, deque] = OrderedDict()
+
+    def record(self, host: str, duration: float) -> None:
+        samples = self._hosts.get(host)
+        if samples is None:
+            samples = self._hosts[host] = deque(maxlen=self.samples_per_host)
+        self._hosts.move_to_end(host)
+        samples.append(duration)
+        while len(self._hosts) > self.max_hosts:
+            self._hosts.popitem(last=False)
+
+    def percentile(self, host: str, q: float, min_samples: int) -> Optional[float]:
+        samples = self._hosts.get(host)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(math.ceil(q * len(ordered)) - 1, len(ordered) - 1)]
+
+
+latency_tracker = LatencyTracker()
+
+
+def is_transient(error: RendererError) -> bool:
+    """Whether a failed render is worth retrying."""
+    if isinstance(error, (ConcurrencyLimitError, ServiceUnavailableError)):
+        return False
+    if isinstance(error, RendererTimeoutError):
+        return True
+    message = str(error)
+    return any(pattern in message for pattern in settings.RETRY_TRANSIENT_PATTERNS)
+
+
+def _requested_waits(kwargs: dict) -> float:
+    """Seconds a render spends in its own ``wait`` and ``post_wait``."""
+    return kwargs.get("wait", 5) + (kwargs.get("post_wait") or 0)
+
+
+async def _timed(host: str, **kwargs) -> dict:
+    start = time.monotonic()
+    result = await run_renderer(**kwargs)
+    # Latency net of the requested waits, so renders with different waits compare
+    latency_tracker.record(host, max(time.monotonic() - start - _requested_waits(kwargs), 0.0))
+    return result
+
+
+async def _hedged_attempt(host: str, hedge: bool, **kwargs) -> dict:
+    """One render attempt, hedged with a second render if it runs unusually long."""
+    primary = asyncio.create_task(_timed(host, **kwargs))
+    tasks = {primary}
+    try:
+        delay = None
+        if hedge:
+            delay = latency_tracker.percentile(host, settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+        if delay is None:
+            return await primary
+
+        timeout = _requested_waits(kwargs) + max(delay, settings.HEDGE_MIN_DELAY)
+        done, _ = await asyncio.wait(tasks, timeout=timeout)
+        if done or get_active_instances() >= settings.MAX_INSTANCES:
+            # Finished in time, or no spare slot to hedge with
+            return await primary
+
+        tasks.add(asyncio.create_task(_timed(host, **kwargs)))
+        metrics.inc("render_hedges_total", "Hedge renders started for slow renders")
+
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        metrics.inc("render_hedge_wins_total", "Hedge renders that finished before the original")
+                    return task.result()
+        # Both failed. Report the original: the hedge may only have been
+        # refused a slot or turned away while draining.
+        raise primary.exception()
+    finally:
+        # Cancelling a losing render kills its browser process
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _retry_loop(host: str, retries: int, hedge: bool, **kwargs) -> dict:
+    attempt = 0
+    last_error = None
+    while True:
+        try:
+            return await _hedged_attempt(host, hedge, **kwargs)
+        except ConcurrencyLimitError:
+            if attempt == 0:
+                raise
+            # Lost the slot while backing off; report the failure that caused the retry
+            raise last_error
+        except RendererError as e:
+            if attempt >= retries or not is_transient(e):
+                raise
+            last_error = e
+        attempt += 1
+        metrics.inc("render_retries_total", "Renders retried after a transient failure")
+        await asyncio.sleep(settings.RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+async def render_with_retries(**kwargs) -> dict:
+    """Run the renderer with retries for transient failures and optional hedging.
+
+    Takes the same arguments as ``run_renderer``. Renders with type or click
+    actions are not repeated since they may have side effects, and renders
+    using a profile are never hedged so two browsers do not share it. The
+    host's circuit breaker rejects the render up front while it is open.
+    """
+    host = urlsplit(kwargs["url"]).hostname or ""
+    repeatable = not kwargs.get("type_actions") and not kwargs.get("click_actions")
+    retries = settings.RENDER_RETRIES if repeatable else 0
+    hedge = settings.HEDGE_ENABLED and repeatable and not kwargs.get("profile")
+
+    if not settings.BREAKER_ENABLED:
+        return await _retry_loop(host, retries, hedge, **kwargs)
+
+    breaker = breakers.get(host)
+    probe = breaker.acquire(time.monotonic())
+    try:
+        result = await _retry_loop(host, retries, hedge, **kwargs)
+    except (ConcurrencyLimitError, ServiceUnavailableError):
+        breaker.release(probe)
+        raise
+    except RendererError as e:
+        if is_transient(e):
+            breaker.record(False, probe, time.monotonic())
+        else:
+            # Deterministic failures, such as a bad exec_js, say nothing about the host
+            breaker.release(probe)
+        raise
+    except BaseException:
+        breaker.release(probe)
+        raise
+    breaker.record(True, probe, time.monotonic())
+    return result
@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Collection, Optional
+
+from .fs import run_fs
+from .renderer import ConcurrencyLimitError, is_draining
+
+# Seconds to wait before retrying a run that found no free renderer slot
+_BUSY_RETRY_DELAY = 15
+# Upper bound on how long the scheduler loop sleeps between due checks
+_MAX_IDLE_SLEEP = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    request TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    jitter REAL NOT NULL,
+    created_at REAL NOT NULL,
+    next_run REAL NOT NULL,
+    last_run REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    schedule_id TEXT NOT NULL REFERENCES schedules(id) ON DELETE CASCADE,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    response TEXT,
+    content BLOB
+);
+CREATE INDEX IF NOT EXISTS results_schedule ON results(schedule_id, id);
+"""
+
+# A runner executes one scheduled request and returns (JSON response, binary content)
+Runner = Callable[[str, dict], Awaitable[tuple[Optional[dict], Optional[bytes]]]]
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+def next_run_time(schedule_id: str, interval: int, jitter: float, now: float) -> float:
+    """Next fire time for a schedule.
+
+    Each schedule gets a stable phase within its interval derived from its id,
+    so schedules sharing an interval are spread out instead of all firing on
+    the minute. Jitter adds a random delay of up to ``jitter * interval``.
+    """
+    phase = int(hashlib.sha256(schedule_id.encode()).hexdigest(), 16) % interval
+    slot = math.floor((now - phase) / interval) * interval + phase + interval
+    return slot + random.uniform(0, jitter * interval)
+
+
+class ScheduleStore:
+    """SQLite persistence for schedules and their bounded result history.
+
+    Methods are blocking; call them through ``run_fs`` so they share the filesystem pool.
+    """
+
+    def __init__(self, path: Path, history_limit: int):
+        self.history_limit = history_limit
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create(self, kind: str, request: dict, interval: int, jitter: float) -> dict:
+        schedule_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO schedules (id, kind, request, interval, jitter, created_at, next_run)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    schedule_id, kind, json.dumps(request), interval, jitter, now,
+                    next_run_time(schedule_id, interval, jitter, now),
+                ),
+            )
+        return self.get(schedule_id)
+
+    def get(self, schedule_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        return self._schedule(row) if row else None
+
+    def all(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM schedules ORDER BY created_at").fetchall()
+        return [self._schedule(row) for row in rows]
+
+    def delete(self, schedule_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _exclusion(exclude: Collection[str]) -> tuple[str, tuple]:
+        if not exclude:
+            return "", ()
+        return f" AND id NOT IN ({', '.join('?' * len(exclude))})", tuple(exclude)
+
+    def due(self, now: float, exclude: Collection[str] = ()) -> list[dict]:
+        """Schedules due by ``now``, except the ids in ``exclude``."""
+        clause, params = self._exclusion(exclude)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM schedules WHERE next_run <= ?{clause} ORDER BY next_run", (now, *params)
+            ).fetchall()
+        return [self._schedule(row) for row in rows]
+
+    def next_due(self, exclude: Collection[str] = ()) -> Optional[float]:
+        """Earliest next run of the schedules not in ``exclude``."""
+        clause, params = self._exclusion(exclude)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT MIN(next_run) FROM schedules WHERE 1{clause}", params
+            ).fetchone()
+        return row[0]
+
+    def set_next_run(self, schedule_id: str, next_run: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE schedules SET next_run = ? WHERE id = ?", (next_run, schedule_id)
+            )
+
+    def add_result(
+        self,
+        schedule_id: str,
+        started_at: float,
+        duration: float,
+        success: bool,
+        error: Optional[str] = None,
+        response: Optional[dict] = None,
+        content: Optional[bytes] = None,
+    ) -> None:
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "UPDATE schedules SET last_run = ? WHERE id = ?", (started_at, schedule_id)
+            ).rowcount
+            if not exists:
+                # Deleted while running
+                return
+            self._conn.execute(
+                "INSERT INTO results (schedule_id, started_at, duration, success, error, response, content)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    schedule_id, started_at, duration, int(success), error,
+                    json.dumps(response) if response is not None else None, content,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE schedule_id = ? AND id NOT IN"
+                " (SELECT id FROM results WHERE schedule_id = ? ORDER BY id DESC LIMIT ?)",
+                (schedule_id, schedule_id, self.history_limit),
+            )
+
+    def results(self, schedule_id: str, limit: int) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, started_at, duration, success, error, response, content IS NOT NULL AS has_content"
+                " FROM results WHERE schedule_id = ? ORDER BY id DESC LIMIT ?",
+                (schedule_id, limit),
+            ).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "started_at": _isoformat(row["started_at"]),
+                "duration": row["duration"],
+                "success": bool(row["success"]),
+                "error": row["error"],
+                "response": json.loads(row["response"]) if row["response"] else None,
+                "has_content": bool(row["has_content"]),
+            }
+            for row in rows
+        ]
+
+    def result_content(self, schedule_id: str, result_id: int) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM results WHERE schedule_id = ? AND id = ?",
+                (schedule_id, result_id),
+            ).fetchone()
+        return row["content"] if row else None
+
+    @staticmethod
+    def _schedule(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "request": json.loads(row["request"]),
+            "interval": row["interval"],
+            "jitter": row["jitter"],
+            "created_at": _isoformat(row["created_at"]),
+            "next_run": _isoformat(row["next_run"]),
+            "last_run": _isoformat(row["last_run"]),
+        }
+
+
+class Scheduler:
+    """Background loop that runs due schedules with bounded concurrency."""
+
+    def __init__(self, store: ScheduleStore, runner: Runner, max_concurrent: int):
+        self.store = store
+        self.runner = runner
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._running: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        if self._loop_task:
+            tasks.append(self._loop_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wakeup(self) -> None:
+        """Re-check due schedules, e.g. after one was created."""
+        self._wakeup.set()
+
+    async def _loop(self) -> None:
+        while True:
+            # Cleared before looking, so a wakeup during this pass triggers another
+            self._wakeup.clear()
+            now = time.time()
+            # While draining, runs already started finish but no new ones begin
+            due = [] if is_draining() else await run_fs(self.store.due, now, set(self._running))
+            for schedule in due:
+                self._running.add(schedule["id"])
+                task = asyncio.create_task(self._run(schedule))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            # Running schedules keep their overdue next_run until they finish
+            next_due = await run_fs(self.store.next_due, set(self._running))
+            delay = _MAX_IDLE_SLEEP if next_due is None else next_due - time.time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(max(delay, 0.1), _MAX_IDLE_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, schedule: dict) -> None:
+        schedule_id = schedule["id"]
+        try:
+            async with self._semaphore:
+                started_at = time.time()
+                try:
+                    response, content = await self.runner(schedule["kind"], schedule["request"])
+                except ConcurrencyLimitError:
+                    # No slot free right now; retry shortly without recording a result
+                    await run_fs(
+                        self.store.set_next_run, schedule_id,
+                        time.time() + random.uniform(1, _BUSY_RETRY_DELAY),
+                    )
+                    return
+                except Exception as e:
+                    await run_fs(
+                        self.store.add_result, schedule_id, started_at,
+                        time.time() - started_at, False, str(e),
+                    )
+                else:
+                    success = response.get("success", True) if response else True
+                    await run_fs(
+                        self.store.add_result, schedule_id, started_at,
+                        time.time() - started_at, success,
+                        response.get("error") if response else None, response, content,
+                    )
+                await run_fs(
+                    self.store.set_next_run, schedule_id,
+                    next_run_time(schedule_id, schedule["interval"], schedule["jitter"], time.time()),
+                )
+        finally:
+            self._running.discard(schedule_id)
+            # Its next run may be earlier than what the loop is sleeping for
+            self.wakeup()
@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import json
+from contextlib import AsyncExitStack
+from typing import Optional
+
+from .config import settings
+from .fs import workspace
+from .models import SessionRequest, SessionStep, SessionStepResult
+from .protocol import FrameReader, ProtocolError
+from .renderer import (
+    ConcurrencyLimitError,
+    RendererError,
+    check_admission,
+    kill_process_group,
+    renderer_proxy_args,
+    spawn_renderer,
+)
+
+_READ_SIZE = 64 * 1024
+# Bytes of renderer stderr kept for error messages
+_STDERR_TAIL = 4096
+# Seconds a closing session gets to exit after stdin is closed
+_CLOSE_TIMEOUT = 5
+
+_active_sessions = 0
+
+
+class RendererSession:
+    """One renderer process kept open for a sequence of steps.
+
+    The renderer runs in session mode: it reads one JSON step per line on
+    stdin and answers each with framed output closed by an end frame.
+    Sessions are counted separately from single renders.
+    """
+
+    def __init__(self, request: SessionRequest):
+        global _active_sessions
+        check_session_admission()
+        _active_sessions += 1
+        self._released = False
+        self.request = request
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._exit_stack = AsyncExitStack()
+        self._pending = b""
+        self._preamble = True
+        self._stderr = b""
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    def _command(self) -> list[str]:
+        cmd = [
+            str(settings.JS_WEB_RENDERER_PATH),
+            "--session",
+            "--framed-output",
+            "--width", str(self.request.width),
+            "--height", str(self.request.height),
+        ]
+        if self.request.profile:
+            cmd.extend(["--profile", str(settings.PROFILES_DIR / self.request.profile)])
+        if self.request.exec_js:
+            cmd.extend(["--exec-js", self.request.exec_js])
+        cmd.extend(renderer_proxy_args())
+        return cmd
+
+    async def start(self) -> None:
+        try:
+            scratch = await self._exit_stack.enter_async_context(workspace())
+            self.process = await spawn_renderer(
+                self._command(),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=str(scratch),
+            )
+        except OSError as e:
+            raise RendererError(str(e))
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+    async def _drain_stderr(self) -> None:
+        while chunk := await self.process.stderr.read(_READ_SIZE):
+            self._stderr = (self._stderr + chunk)[-_STDERR_TAIL:]
+
+    def _exit_error(self) -> str:
+        return self._stderr.decode(errors="replace").strip() or "Renderer session ended unexpectedly"
+
+    async def _read_step_output(self) -> FrameReader:
+        reader = FrameReader(preamble=self._preamble)
+        reader.feed(self._pending)
+        while not reader.finished:
+            chunk = await self.process.stdout.read(_READ_SIZE)
+            if not chunk:
+                raise RendererError(self._exit_error())
+            reader.feed(chunk)
+        self._preamble = False
+        self._pending = reader.remainder
+        return reader
+
+    async def run_step(self, index: int, step: SessionStep) -> SessionStepResult:
+        command = {
+            "url": step.url,
+            "wait": step.wait,
+            "type": [[a.selector, a.value] for a in step.type_actions or []],
+            "click": step.click_actions or [],
+            "wait_for": step.wait_for,
+            "post_wait": step.post_wait,
+            "post_js": step.post_js,
+            "capture": step.capture,
+        }
+        timeout = step.wait + (step.post_wait or 0) + self.request.idle_timeout
+        try:
+            self.process.stdin.write(json.dumps(command).encode() + b"\n")
+            await self.process.stdin.drain()
+            reader = await asyncio.wait_for(self._read_step_output(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # A hung browser will not exit on request either
+            kill_process_group(self.process)
+            return SessionStepResult(index=index, success=False, error="Session step timed out")
+        except asyncio.CancelledError:
+            # Abandoned mid-step, e.g. on client disconnect; the renderer is still busy
+            kill_process_group(self.process)
+            raise
+        except (ConnectionError, ProtocolError) as e:
+            return SessionStepResult(index=index, success=False, error=str(e) or self._exit_error())
+        except RendererError as e:
+            return SessionStepResult(index=index, success=False, error=str(e))
+
+        if reader.error is not None:
+            return SessionStepResult(index=index, success=False, error=reader.error)
+
+        result = reader.result(network="network" in step.capture)
+        screenshot = result.get("screenshot_data")
+        return SessionStepResult(
+            index=index,
+            success=True,
+            html=result["html"],
+            current_url=result["current_url"],
+            screenshot=base64.b64encode(screenshot).decode() if screenshot else None,
+            requests=result.get("network_data"),
+            timings=result["timings"],
+        )
+
+    async def close(self) -> None:
+        """Ask the renderer to exit, kill it if it does not, and release the slot."""
+        global _active_sessions
+        try:
+            if self.process is not None:
+                try:
+                    if self.process.returncode is None:
+                        self.process.stdin.close()
+                        await asyncio.wait_for(self.process.wait(), timeout=_CLOSE_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError):
+                    kill_process_group(self.process)
+                    await self.process.wait()
+                except BaseException:
+                    # Cancelled, e.g. by a client disconnect. Later awaits may be
+                    # cancelled as well, so the kill must not wait for them.
+                    kill_process_group(self.process)
+                    raise
+                await self._stderr_task
+        finally:
+            try:
+                await self._exit_stack.aclose()
+            finally:
+                if not self._released:
+                    self._released = True
+                    _active_sessions -= 1
+
+
+def check_session_admission() -> None:
+    """Raise if a new session would be refused, without taking a slot."""
+    check_admission()
+    if _active_sessions >= settings.MAX_SESSIONS:
+        raise ConcurrencyLimitError(
+            f"Too many concurrent sessions. Limit is {settings.MAX_SESSIONS}."
+        )
+
+
+def get_active_sessions() -> int:
+    """Get the current number of open renderer sessions."""
+    return _active_sessions
@@ -0,0 +1,163 @@
+"""Local certificate authority used by the caching proxy to intercept HTTPS.
+
+The CA key and certificate are created once and kept in a directory so the
+renderer's trust settings stay valid across restarts. Per-host leaf
+certificates share one key, are issued on first use and kept in memory as
+ready server contexts.
+"""
+import base64
+import datetime
+import hashlib
+import ipaddress
+import os
+import shutil
+import ssl
+from collections import OrderedDict
+from pathlib import Path
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from .fs import run_fs
+
+_CA_VALIDITY = datetime.timedelta(days=3650)
+_LEAF_VALIDITY = datetime.timedelta(days=30)
+# Leaf certificates are reissued once they get this close to expiry
+_LEAF_RENEW_BEFORE = datetime.timedelta(days=1)
+# Hosts whose server contexts are kept before the least recently used is dropped
+_MAX_HOSTS = 1000
+
+
+def _pem_key(key) -> bytes:
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def _write_private(path: Path, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+
+def _subject_alt_name(host: str) -> x509.GeneralName:
+    try:
+        return x509.IPAddress(ipaddress.ip_address(host))
+    except ValueError:
+        return x509.DNSName(host)
+
+
+class CertificateAuthority:
+    """Issues server certificates for intercepted hosts.
+
+    Blocking: create it and call ``issue`` from a thread; ``server_context``
+    does that itself.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.cert_path = directory / "ca.pem"
+        self.key_path = directory / "ca-key.pem"
+        self._hosts_dir = directory / "hosts"
+        directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+
+        if self.cert_path.exists() and self.key_path.exists():
+            self._cert = x509.load_pem_x509_certificate(self.cert_path.read_bytes())
+            self._key = serialization.load_pem_private_key(self.key_path.read_bytes(), password=None)
+        else:
+            self._key = ec.generate_private_key(ec.SECP256R1())
+            self._cert = self._create_ca_cert()
+            _write_private(self.key_path, _pem_key(self._key))
+            self.cert_path.write_bytes(self._cert.public_bytes(serialization.Encoding.PEM))
+
+        # Leaf keys are per process; certificates issued by a previous run are stale
+        shutil.rmtree(self._hosts_dir, ignore_errors=True)
+        self._hosts_dir.mkdir(mode=0o700)
+        self._leaf_key = ec.generate_private_key(ec.SECP256R1())
+        self._contexts: OrderedDict[str, tuple[ssl.SSLContext, datetime.datetime]] = OrderedDict()
+
+    def _create_ca_cert(self) -> x509.Certificate:
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "js-web-renderer cache proxy CA")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self._key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + _CA_VALIDITY)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .add_extension(
+                x509.KeyUsage(
+                    digital_signature=False, content_commitment=False, key_encipherment=False,
+                    data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                    crl_sign=True, encipher_only=False, decipher_only=False,
+                ),
+                critical=True,
+            )
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(self._key.public_key()), critical=False)
+            .sign(self._key, hashes.SHA256())
+        )
+
+    @property
+    def spki_hash(self) -> str:
+        """Base64 SHA-256 of the CA's public key, as Chromium's SPKI allow-lists expect."""
+        der = self._cert.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return base64.b64encode(hashlib.sha256(der).digest()).decode()
+
+    def issue(self, host: str) -> tuple[Path, datetime.datetime]:
+        """Write a PEM with a leaf certificate for ``host``, the CA certificate and the leaf key."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        expires = now + _LEAF_VALIDITY
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host[:64])]))
+            .issuer_name(self._cert.subject)
+            .public_key(self._leaf_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(expires)
+            .add_extension(x509.SubjectAlternativeName([_subject_alt_name(host)]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+            .add_extension(
+                x509.AuthorityKeyIdentifier.from_issuer_public_key(self._key.public_key()), critical=False
+            )
+            .sign(self._key, hashes.SHA256())
+        )
+        path = self._hosts_dir / f"{hashlib.sha256(host.encode()).hexdigest()}.pem"
+        _write_private(path, b"".join([
+            cert.public_bytes(serialization.Encoding.PEM),
+            self._cert.public_bytes(serialization.Encoding.PEM),
+            _pem_key(self._leaf_key),
+        ]))
+        return path, expires
+
+    def _create_context(self, host: str) -> tuple[ssl.SSLContext, datetime.datetime]:
+        path, expires = self.issue(host)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        try:
+            context.load_cert_chain(path)
+        finally:
+            path.unlink(missing_ok=True)
+        # The proxy speaks HTTP/1.1 only
+        context.set_alpn_protocols(["http/1.1"])
+        return context, expires
+
+    async def server_context(self, host: str) -> ssl.SSLContext:
+        """TLS server context presenting a certificate for ``host``."""
+        entry = self._contexts.get(host)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if entry is None or entry[1] - now < _LEAF_RENEW_BEFORE:
+            entry = self._contexts[host] = await run_fs(self._create_context, host)
+        self._contexts.move_to_end(host)
+        while len(self._contexts) > _MAX_HOSTS:
+            self._contexts.popitem(last=False)
+        return entry[0]
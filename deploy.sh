@@ -7,6 +7,10 @@ ssh whisper1 "cd /opt/js-web-renderer-api && git fetch origin master && git rese
 # Fix permissions - js-web-render user needs to read the CLI
 ssh whisper1 "sudo chmod +x /opt/js-web-renderer/bin/fetch-rendered.py"
 
+# Restart drains in-flight renders first (up to DRAIN_TIMEOUT)
 ssh whisper1 "sudo systemctl restart js-web-renderer-api && sudo systemctl status js-web-renderer-api --no-pager"
 
+echo "Waiting for the service to report ready..."
+ssh whisper1 'for i in $(seq 1 60); do curl -fs http://localhost:9000/health/ready > /dev/null && exit 0; sleep 2; done; echo "Service did not become ready" >&2; exit 1'
+
 echo "Deployment complete!"
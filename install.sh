@@ -13,6 +13,8 @@ echo "Installing js-web-renderer REST API..."
 # Create install directory
 sudo mkdir -p "$INSTALL_DIR"
 sudo mkdir -p /opt/js-web-renderer/profiles
+sudo mkdir -p /home/js-web-render/scheduler
+sudo chown js-web-render: /home/js-web-render/scheduler
 
 # Copy files
 sudo cp -r "$SCRIPT_DIR/app" "$INSTALL_DIR/"
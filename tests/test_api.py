@@ -1,3 +1,4 @@
+import json
 import pytest
 import httpx
 import os
@@ -7,6 +8,8 @@ import os
 API_KEY = os.environ.get("API_KEY", "test-api-key")
 BASE_URL = os.environ.get("TEST_BASE_URL", "http://localhost:9000")
 HEADERS = {"X-API-Key": API_KEY}
+# Whether the server under test has SESSIONS_ENABLED (needs a renderer supporting --session)
+SESSIONS_ENABLED = os.environ.get("SESSIONS_ENABLED", "false").lower() in ("1", "true", "yes")
 
 
 class TestAPI:
@@ -31,6 +34,28 @@ class TestAPI:
         assert isinstance(data["max_instances"], int)
         assert data["max_instances"] == 4  # Default MAX_INSTANCES
 
+    def test_liveness_no_auth(self):
+        """Test liveness probe without authentication."""
+        response = httpx.get(f"{BASE_URL}/health/live")
+        assert response.status_code == 200
+        assert response.json()["status"] == "alive"
+
+    def test_readiness_when_idle(self):
+        """Test readiness probe reports ready with free slots."""
+        response = httpx.get(f"{BASE_URL}/health/ready")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["ready"] is True
+        assert data["reasons"] == []
+        assert data["active_instances"] < data["max_instances"]
+
+    def test_metrics_no_auth(self):
+        """Test metrics endpoint without authentication."""
+        response = httpx.get(f"{BASE_URL}/metrics")
+        assert response.status_code == 200
+        assert "event_loop_lag_seconds" in response.text
+        assert "active_instances" in response.text
+
     def test_render_requires_auth(self):
         """Test render endpoint requires authentication."""
         response = httpx.post(
@@ -166,3 +191,123 @@ class TestAPI:
         assert "success" in data
         assert "html" in data
         assert "current_url" in data
+
+    def test_render_with_extract(self):
+        """Test render with server-side extraction."""
+        response = httpx.post(
+            f"{BASE_URL}/render",
+            json={
+                "url": "https://example.com",
+                "wait": 3,
+                "extract": {
+                    "text": True,
+                    "links": True,
+                    "css": ["h1"],
+                    "include_html": False,
+                },
+            },
+            headers=HEADERS,
+            timeout=60
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["html"] is None
+        extracted = data["extracted"]
+        assert "Example Domain" in extracted["text"]
+        assert all(link["url"].startswith("http") for link in extracted["links"])
+        assert len(extracted["css"]["h1"]) == 1
+
+    def test_render_if_changed_since(self):
+        """Test repeated render of an unchanged page returns not modified."""
+        response = httpx.post(
+            f"{BASE_URL}/render",
+            json={"url": "https://example.com", "wait": 3, "track_changes": True},
+            headers=HEADERS,
+            timeout=60
+        )
+        assert response.status_code == 200
+        fingerprint = response.json()["fingerprint"]
+        assert fingerprint
+
+        response = httpx.post(
+            f"{BASE_URL}/render",
+            json={"url": "https://example.com", "wait": 3, "if_changed_since": fingerprint},
+            headers=HEADERS,
+            timeout=60
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        # example.com serves a static page
+        assert data["not_modified"] is True
+        assert data["html"] is None
+        assert data["fingerprint"] == fingerprint
+
+    def test_schedules_create_and_delete(self):
+        """Test schedule creation, listing and deletion."""
+        response = httpx.post(
+            f"{BASE_URL}/schedules",
+            json={
+                "kind": "render",
+                "request": {"url": "https://example.com", "wait": 2},
+                "interval": 3600,
+            },
+            headers=HEADERS
+        )
+        assert response.status_code == 200
+        schedule = response.json()
+        assert schedule["request"]["url"] == "https://example.com"
+
+        response = httpx.get(f"{BASE_URL}/schedules", headers=HEADERS)
+        assert response.status_code == 200
+        assert schedule["id"] in [s["id"] for s in response.json()["schedules"]]
+
+        response = httpx.get(f"{BASE_URL}/schedules/{schedule['id']}/results", headers=HEADERS)
+        assert response.status_code == 200
+        assert isinstance(response.json()["results"], list)
+
+        response = httpx.delete(f"{BASE_URL}/schedules/{schedule['id']}", headers=HEADERS)
+        assert response.status_code == 200
+
+        response = httpx.get(f"{BASE_URL}/schedules/{schedule['id']}", headers=HEADERS)
+        assert response.status_code == 404
+
+    def test_schedule_invalid_request(self):
+        """Test schedule with an invalid request body is rejected."""
+        response = httpx.post(
+            f"{BASE_URL}/schedules",
+            json={"kind": "screenshot", "request": {"url": "https://example.com", "width": 1}, "interval": 3600},
+            headers=HEADERS
+        )
+        assert response.status_code == 422
+
+    @pytest.mark.skipif(SESSIONS_ENABLED, reason="server runs with SESSIONS_ENABLED")
+    def test_session_disabled(self):
+        """Test session endpoint answers 501 while sessions are disabled."""
+        response = httpx.post(
+            f"{BASE_URL}/session",
+            json={"steps": [{"url": "https://example.com"}]},
+            headers=HEADERS
+        )
+        assert response.status_code == 501
+
+    @pytest.mark.skipif(not SESSIONS_ENABLED, reason="server runs without SESSIONS_ENABLED")
+    def test_session_streams_step_results(self):
+        """Test session endpoint returns one result line per step."""
+        response = httpx.post(
+            f"{BASE_URL}/session",
+            json={
+                "steps": [
+                    {"url": "https://example.com", "wait": 2},
+                    {"url": "https://example.org", "wait": 2, "capture": ["html", "network"]},
+                ],
+            },
+            headers=HEADERS,
+            timeout=120
+        )
+        assert response.status_code == 200
+        results = [json.loads(line) for line in response.text.splitlines() if line]
+        assert [(r["index"], r["success"]) for r in results] == [(0, True), (1, True)]
+        assert results[1]["html"] is not None
+        assert results[1]["requests"] is not None
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from app import retries
+from app.breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker, CircuitOpenError
+from app.config import settings
+from app.metrics import metrics
+from app.renderer import RendererError
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_WINDOW", 60.0)
+    monkeypatch.setattr(settings, "BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(settings, "BREAKER_COOLDOWN", 30.0)
+    monkeypatch.setattr(settings, "BREAKER_HALF_OPEN_PROBES", 1)
+
+
+def fail(breaker, now, count=1):
+    for _ in range(count):
+        probe = breaker.acquire(now)
+        breaker.record(False, probe, now)
+
+
+class TestCircuitBreaker:
+    """Test per-host circuit breaker state transitions."""
+
+    def test_opens_on_failure_rate(self):
+        """Test the breaker opens once enough renders in the window failed."""
+        breaker = CircuitBreaker("example.com")
+        breaker.record(True, breaker.acquire(0), 0)
+        fail(breaker, 1, count=2)
+        assert breaker.state == CLOSED
+        fail(breaker, 2)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire(3)
+
+    def test_old_failures_leave_window(self):
+        """Test failures outside the sliding window are not counted."""
+        breaker = CircuitBreaker("example.com")
+        fail(breaker, 0, count=3)
+        for now in (100, 101, 102):
+            breaker.record(True, breaker.acquire(now), now)
+        fail(breaker, 103)
+        assert breaker.state == CLOSED
+
+    def test_half_open_probe_success_closes(self):
+        """Test a successful probe after the cooldown closes the breaker."""
+        breaker = CircuitBreaker("example.com")
+        fail(breaker, 0, count=4)
+        probe = breaker.acquire(31)
+        assert probe is True
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire(31)
+        breaker.record(True, probe, 32)
+        assert breaker.state == CLOSED
+        assert breaker.acquire(33) is False
+
+    def test_half_open_probe_failure_reopens(self):
+        """Test a failed probe opens the breaker for another cooldown."""
+        breaker = CircuitBreaker("example.com")
+        fail(breaker, 0, count=4)
+        fail(breaker, 31)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire(60)
+
+    def test_released_probe_frees_slot(self):
+        """Test a probe that ended without an outcome lets another probe through."""
+        breaker = CircuitBreaker("example.com")
+        fail(breaker, 0, count=4)
+        breaker.release(breaker.acquire(31))
+        assert breaker.acquire(31) is True
+
+    def test_stale_probe_outcome_ignored(self, monkeypatch):
+        """Test probes from an earlier half-open window do not free slots in the next one."""
+        monkeypatch.setattr(settings, "BREAKER_HALF_OPEN_PROBES", 2)
+        breaker = CircuitBreaker("example.com")
+        fail(breaker, 0, count=4)
+        first, second = breaker.acquire(31), breaker.acquire(31)
+        breaker.record(False, first, 32)
+        assert breaker.state == OPEN
+        breaker.record(True, second, 33)
+        assert breaker.acquire(63) is True
+        assert breaker.acquire(63) is True
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire(63)
+
+
+class TestBreakerRegistry:
+    """Test the breaker registry and its exported state."""
+
+    def state(self, host):
+        return metrics.get("circuit_breaker_state", labels={"host": host})
+
+    def series(self):
+        return metrics.render().count("circuit_breaker_state{")
+
+    def test_only_open_hosts_exported(self):
+        """Test closed breakers have no series and evicted or reset ones lose theirs."""
+        registry = BreakerRegistry(max_hosts=2)
+        before = self.series()
+        fail(registry.get("a.test"), 0, count=4)
+        assert self.state("a.test") == 2
+        registry.get("b.test")
+        assert self.series() == before + 1
+        registry.get("c.test")
+        assert registry.find("a.test") is None
+        assert self.series() == before
+
+        fail(registry.get("b.test"), 0, count=4)
+        assert self.series() == before + 1
+        assert registry.reset("b.test")
+        assert self.series() == before
+
+    def test_closing_removes_series(self):
+        """Test a breaker that closes again is no longer exported."""
+        breaker = CircuitBreaker("closes.test")
+        fail(breaker, 0, count=4)
+        breaker.record(True, breaker.acquire(31), 32)
+        assert breaker.state == CLOSED
+        assert 'circuit_breaker_state{host="closes.test"}' not in metrics.render()
+
+    def test_client_errors_not_counted(self, monkeypatch):
+        """Test deterministic render errors do not open the breaker, transient ones do."""
+        registry = BreakerRegistry()
+        error = RendererError("Renderer exited with code 1")
+
+        async def run_renderer(**kwargs):
+            raise error
+
+        monkeypatch.setattr(retries, "breakers", registry)
+        monkeypatch.setattr(retries, "run_renderer", run_renderer)
+        monkeypatch.setattr(settings, "BREAKER_ENABLED", True)
+        monkeypatch.setattr(settings, "RENDER_RETRIES", 0)
+
+        async def render():
+            with pytest.raises(RendererError):
+                await retries.render_with_retries(url="https://bad.test/")
+
+        for _ in range(4):
+            asyncio.run(render())
+        assert registry.get("bad.test").state == CLOSED
+
+        error = RendererError("net::ERR_CONNECTION_RESET at https://bad.test/")
+        for _ in range(4):
+            asyncio.run(render())
+        assert registry.get("bad.test").state == OPEN
+
+    def test_counters_not_per_host(self):
+        """Test breaker counters are totals without a series per host."""
+        opened = metrics.get("circuit_breaker_opened_total")
+        rejected = metrics.get("circuit_breaker_rejections_total")
+        breaker = CircuitBreaker("counted.test")
+        fail(breaker, 0, count=4)
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire(1)
+        assert metrics.get("circuit_breaker_opened_total") == opened + 1
+        assert metrics.get("circuit_breaker_rejections_total") == rejected + 1
+        assert "circuit_breaker_opened_total{" not in metrics.render()
+        assert "circuit_breaker_rejections_total{" not in metrics.render()
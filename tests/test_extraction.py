@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import pytest
+
+from app.extraction import ExtractionError, extract, run_in_pool, shutdown_extraction
+
+PAGE = """<html><head><title>t</title></head><body>
+<nav><a href="/home">Home</a><a href="/about">About</a><a href="/contact">Contact</a></nav>
+<div class="sidebar"><p><a href="/one">One</a> <a href="/two">Two</a> <a href="/three">Three</a></p></div>
+<article>
+<h1>Headline</h1>
+<p>The first paragraph of the story with <a href="/more#details">a link</a> and <b>bold</b> text.</p>
+<p>A second paragraph that carries most of the readable content on this page.</p>
+</article>
+<footer>Footer text</footer>
+</body></html>"""
+
+
+class TestExtract:
+    """Test server-side extraction of rendered HTML."""
+
+    def test_readability_picks_article(self):
+        """Test main content is the article, without navigation, sidebar or footer."""
+        result = extract(PAGE, "https://example.com/page", {"text": True})
+        assert result["text"].startswith("Headline")
+        assert "second paragraph" in result["text"]
+        assert "Home" not in result["text"]
+        assert "Three" not in result["text"]
+        assert "Footer" not in result["text"]
+
+    def test_markdown(self):
+        """Test Markdown output with headings, emphasis and resolved links."""
+        result = extract(PAGE, "https://example.com/page", {"markdown": True})
+        assert result["markdown"].startswith("# Headline")
+        assert "**bold**" in result["markdown"]
+        assert "[a link](https://example.com/more)" in result["markdown"]
+
+    def test_links_resolved_and_deduplicated(self):
+        """Test links are absolute, without fragments and listed once."""
+        html = '<html><body><a href="/a#x">A</a><a href="/a#y">A again</a><a href="#top">Top</a><a href="mailto:x@y">Mail</a></body></html>'
+        result = extract(html, "https://example.com/dir/page", {"links": True})
+        assert result["links"] == [{"url": "https://example.com/a", "text": "A"}]
+
+    def test_base_href(self):
+        """Test a <base href> takes precedence over the page URL."""
+        html = '<html><head><base href="https://cdn.example.org/root/"></head><body><p><a href="doc#part">Doc</a></p></body></html>'
+        result = extract(html, "https://example.com/page", {"links": True, "markdown": True})
+        assert result["links"][0]["url"] == "https://cdn.example.org/root/doc"
+        assert "(https://cdn.example.org/root/doc)" in result["markdown"]
+
+    def test_css_and_xpath(self):
+        """Test selector matches are serialized elements or strings."""
+        result = extract(PAGE, None, {"css": ["h1"], "xpath": ["//h1/text()", "count(//p)"]})
+        assert result["css"] == {"h1": ["<h1>Headline</h1>"]}
+        assert result["xpath"]["//h1/text()"] == ["Headline"]
+        assert result["xpath"]["count(//p)"] == ["3.0"]
+
+    def test_invalid_css_selector(self):
+        """Test an invalid CSS selector raises ExtractionError."""
+        with pytest.raises(ExtractionError, match="Invalid CSS selector"):
+            extract(PAGE, None, {"css": ["p[["]})
+
+    def test_invalid_xpath(self):
+        """Test an invalid XPath expression raises ExtractionError."""
+        with pytest.raises(ExtractionError, match="Invalid XPath expression"):
+            extract(PAGE, None, {"xpath": ["//p["]})
+
+    def test_empty_html(self):
+        """Test empty HTML raises ExtractionError."""
+        with pytest.raises(ExtractionError):
+            extract("  ", None, {"text": True})
+
+
+class TestWorkerPool:
+    """Test the extraction worker pool."""
+
+    def test_recovers_from_crashed_worker(self):
+        """Test a worker dying fails only its own call and the pool is replaced."""
+        try:
+            with pytest.raises(ExtractionError, match="crashed"):
+                asyncio.run(run_in_pool(os._exit, 1))
+            assert asyncio.run(run_in_pool(len, "abc")) == 3
+        finally:
+            shutdown_extraction()
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from app import fingerprints
+from app.fingerprints import FingerprintStore, detect_changes, diff, fingerprint, hamming_distance, simhash
+
+PAGE = "<html><body><h1>Title</h1><p>%s</p><ul>%s</ul></body></html>"
+TEXT = "A steady paragraph of page text that stays the same between renders of this page"
+
+
+def page(title="Title", items=("one", "two")):
+    return PAGE.replace("Title", title) % (TEXT, "".join(f"<li>{item}</li>" for item in items))
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    store = FingerprintStore(max_entries=100, max_bytes=1024 * 1024)
+    monkeypatch.setattr(fingerprints, "fingerprint_store", store)
+    monkeypatch.setattr(fingerprints, "run_in_pool", run_inline)
+    return store
+
+
+def changes(html, if_changed_since=None, tolerance=0):
+    return asyncio.run(detect_changes("key", html, if_changed_since, tolerance))
+
+
+class TestFingerprints:
+    """Test change detection, simhash tolerance and structural diffs."""
+
+    def test_not_modified(self):
+        """Test an unchanged page is reported not modified."""
+        first = changes(page())
+        assert first["not_modified"] is False
+        second = changes(page(), first["fingerprint"])
+        assert second == {"fingerprint": first["fingerprint"], "not_modified": True, "diff": None}
+
+    def test_changed_page_returns_diff(self):
+        """Test a changed page returns a diff of the changed lines only."""
+        first = changes(page(items=[f"item {i}" for i in range(50)]))
+        second = changes(page(title="Other", items=[f"item {i}" for i in range(50)]), first["fingerprint"])
+        assert second["not_modified"] is False
+        assert second["fingerprint"] != first["fingerprint"]
+        assert "-<h1>Title</h1>" in second["diff"]
+        assert "+<h1>Other</h1>" in second["diff"]
+        assert not any("item 10" in line for line in second["diff"])
+
+    def test_diff_larger_than_page_falls_back(self):
+        """Test no diff is returned when it would be bigger than the page."""
+        first = changes(page(items=[f"a{i}" for i in range(200)]))
+        second = changes(page(items=[f"b{i}" for i in range(200)]), first["fingerprint"])
+        assert second["not_modified"] is False
+        assert second["diff"] is None
+
+    def test_tolerance(self):
+        """Test small text changes count as unchanged only within the tolerance."""
+        old, new = page(items=["one", "two"]), page(items=["one", "three"])
+        distance = hamming_distance(fingerprint(old).simhash, fingerprint(new).simhash)
+        assert 0 < distance < 32
+
+        first = changes(old)
+        second = changes(new, first["fingerprint"], tolerance=distance - 1)
+        assert second["not_modified"] is False
+
+        first = changes(old)
+        third = changes(new, first["fingerprint"], tolerance=distance)
+        assert third["not_modified"] is True
+        assert third["fingerprint"] == first["fingerprint"]
+
+    def test_unknown_fingerprint(self):
+        """Test a fingerprint no longer stored gets the full page back."""
+        result = changes(page(), "0" * 64)
+        assert result["not_modified"] is False
+        assert result["diff"] is None
+
+    def test_simhash_distance(self):
+        """Test near-identical texts are closer than unrelated ones."""
+        base = simhash(TEXT + " with one ending")
+        near = simhash(TEXT + " with another ending")
+        far = simhash("Completely different words describing an unrelated topic entirely here")
+        assert hamming_distance(base, base) == 0
+        assert hamming_distance(base, near) < hamming_distance(base, far)
+
+    def test_diff(self):
+        """Test the diff follows tag structure."""
+        lines = diff(fingerprint("<p>a</p><p>b</p>"), fingerprint("<p>a</p><p>c</p>"))
+        assert "-<p>b</p>" in lines
+        assert "+<p>c</p>" in lines
+        assert "<p>a</p>" not in [line[1:] for line in lines if line[:1] in "+-"]
+
+
+class TestFingerprintStore:
+    """Test the fingerprint store bounds."""
+
+    def test_byte_budget(self):
+        """Test least recently used entries are evicted to stay within the byte budget."""
+        entry = fingerprint(page())
+        size = len(entry.lines) + fingerprints._ENTRY_OVERHEAD
+        store = FingerprintStore(max_entries=100, max_bytes=size * 2)
+        store.put("a", entry)
+        store.put("b", entry)
+        store.get("a")
+        store.put("c", entry)
+        assert store.get("b") is None
+        assert store.get("a") is entry
+        assert store.get("c") is entry
+        assert store.size == size * 2
+
+    def test_oversized_entry_not_stored(self):
+        """Test an entry larger than the whole budget is not kept."""
+        entry = fingerprint(page())
+        store = FingerprintStore(max_entries=100, max_bytes=10)
+        store.put("a", entry)
+        assert store.get("a") is None
+        assert store.size == 0
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+from app.protocol import MAGIC, VERSION, FrameReader, ProtocolError, TruncatedOutputError, read_output
+
+
+def frame(frame_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">cI", frame_type, len(payload)) + payload
+
+
+def output(*frames: bytes, version: int = VERSION) -> bytes:
+    return MAGIC + bytes([version]) + b"".join(frames)
+
+
+def read(data: bytes, **kwargs) -> dict:
+    async def main():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        return await read_output(stream, **kwargs)
+
+    return asyncio.run(main())
+
+
+PAGE = output(
+    frame(b"M", json.dumps({"current_url": "https://example.com/"}).encode()),
+    frame(b"H", b"<html><body>"),
+    frame(b"H", "<p>héllo</p></body></html>".encode()),
+    frame(b"T", json.dumps({"navigate": 1.5}).encode()),
+    frame(b"E", b""),
+)
+
+
+class TestFrameReader:
+    """Test incremental parsing of the framed output protocol."""
+
+    def test_multi_frame_html(self):
+        """Test HTML split over several frames is joined."""
+        reader = FrameReader()
+        reader.feed(PAGE)
+        assert reader.finished
+        assert reader.result() == {
+            "success": True,
+            "html": "<html><body><p>héllo</p></body></html>",
+            "current_url": "https://example.com/",
+            "timings": {"navigate": 1.5},
+        }
+
+    def test_split_across_feeds(self):
+        """Test byte-at-a-time feeding gives the same result, including a split UTF-8 character."""
+        reader = FrameReader()
+        for i in range(len(PAGE)):
+            assert not reader.finished
+            reader.feed(PAGE[i:i + 1])
+        assert reader.finished
+        assert reader.result()["html"] == "<html><body><p>héllo</p></body></html>"
+
+    def test_screenshot_and_network(self):
+        """Test screenshot bytes over several frames and network records."""
+        reader = FrameReader()
+        reader.feed(output(
+            frame(b"S", b"\x89PNG"),
+            frame(b"S", b"rest"),
+            frame(b"N", json.dumps({"url": "https://example.com/app.js"}).encode()),
+            frame(b"Z", b"unknown frames are skipped"),
+            frame(b"E", b""),
+        ))
+        result = reader.result(network=True)
+        assert result["screenshot_data"] == b"\x89PNGrest"
+        assert result["network_data"] == [{"url": "https://example.com/app.js"}]
+        assert result["html"] is None
+
+    def test_error_frame(self):
+        """Test an error frame is reported."""
+        reader = FrameReader()
+        reader.feed(output(frame(b"X", b"net::ERR_NAME_NOT_RESOLVED"), frame(b"E", b"")))
+        assert reader.error == "net::ERR_NAME_NOT_RESOLVED"
+
+    def test_version_mismatch(self):
+        """Test an unknown protocol version is rejected."""
+        with pytest.raises(ProtocolError, match="version"):
+            FrameReader().feed(output(frame(b"E", b""), version=VERSION + 1))
+
+    def test_missing_end_frame(self):
+        """Test output without an end frame has no result."""
+        reader = FrameReader()
+        reader.feed(PAGE[:-5])
+        assert not reader.finished
+        with pytest.raises(ProtocolError, match="end frame"):
+            reader.result()
+
+    def test_oversized_frame(self):
+        """Test a frame header announcing more than the limit is rejected."""
+        with pytest.raises(ProtocolError, match="exceeds limit"):
+            FrameReader().feed(MAGIC + bytes([VERSION]) + struct.pack(">cI", b"H", 2 ** 32 - 1))
+
+    def test_malformed_json(self):
+        """Test a malformed JSON frame raises ProtocolError."""
+        with pytest.raises(ProtocolError, match="Malformed M frame"):
+            FrameReader().feed(output(frame(b"M", b"{not json")))
+
+    def test_remainder_without_preamble(self):
+        """Test session readers skip the preamble and keep bytes after the end frame."""
+        second = frame(b"H", b"<p>2</p>") + frame(b"E", b"")
+        reader = FrameReader(preamble=False)
+        reader.feed(frame(b"H", b"<p>1</p>") + frame(b"E", b"") + second)
+        assert reader.result()["html"] == "<p>1</p>"
+        assert reader.remainder == second
+
+
+class TestReadOutput:
+    """Test reading renderer stdout in either format."""
+
+    def test_framed(self):
+        """Test framed output is detected by its magic."""
+        assert read(PAGE)["current_url"] == "https://example.com/"
+
+    def test_data_after_end_frame(self):
+        """Test bytes after the end frame are rejected."""
+        with pytest.raises(ProtocolError, match="after end frame"):
+            read(PAGE + b"junk")
+
+    def test_framed_missing_end(self):
+        """Test framed output cut off before the end frame is rejected."""
+        with pytest.raises(TruncatedOutputError):
+            read(PAGE[:-5])
+
+    def test_framed_error(self):
+        """Test an error frame becomes an unsuccessful result."""
+        result = read(output(frame(b"X", b"boom"), frame(b"E", b"")))
+        assert result == {"success": False, "error": "boom"}
+
+    def test_legacy_text(self):
+        """Test legacy text output with a CURRENT_URL line."""
+        result = read(b"CURRENT_URL: https://example.com/\n<html></html>\n")
+        assert result["current_url"] == "https://example.com/"
+        assert result["html"] == "<html></html>\n"
+
+    def test_legacy_short_output(self):
+        """Test legacy output shorter than the magic is not mistaken for framed output."""
+        assert read(b"<p>")["html"] == "<p>"
+        assert read(b"")["html"] == ""
+
+    def test_legacy_network(self):
+        """Test legacy network output lists one URL per line."""
+        result = read(b"https://example.com/\nhttps://example.com/app.js\n", network=True)
+        assert result["network_data"] == [
+            {"url": "https://example.com/"},
+            {"url": "https://example.com/app.js"},
+        ]
@@ -0,0 +1,342 @@
+import asyncio
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.metrics import metrics
+from app.proxy import CacheProxy, DiskCache
+from app.renderer import renderer_env, renderer_proxy_args, set_proxy_url
+from app.tls import CertificateAuthority
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """Local origin server stand-in with one route per caching behaviour."""
+
+    protocol_version = "HTTP/1.1"
+    routes = {
+        "/cached": (200, {"Cache-Control": "max-age=60", "Content-Type": "text/html"}, b"cached body"),
+        "/no-store": (200, {"Cache-Control": "no-store", "Content-Type": "text/html"}, b"no-store body"),
+        "/app.js": (200, {"Content-Type": "application/javascript"}, b"console.log(1);"),
+        "/page": (200, {"Content-Type": "text/html"}, b"uncacheable page"),
+        "/etag": (200, {"Cache-Control": "max-age=0", "ETag": '"v1"', "Content-Type": "text/css"}, b"body{}"),
+        "/a.css": (200, {"Content-Type": "text/css"}, b"a" * 10),
+        "/b.css": (200, {"Content-Type": "text/css"}, b"b" * 10),
+        "/c.css": (200, {"Content-Type": "text/css"}, b"c" * 10),
+    }
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        if self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Cache-Control", "max-age=60")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (b"first ", b"second"):
+                self.wfile.write(b"%x\r\n%b\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        status, headers, body = self.routes.get(self.path, (404, {}, b"not found"))
+        if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    server.hits = {}
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ca(tmp_path):
+    return CertificateAuthority(tmp_path / "ca")
+
+
+@pytest.fixture
+def tls_origin(ca):
+    """HTTPS origin with a certificate from the proxy CA, so the proxy can verify it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OriginHandler)
+    server.hits = {}
+    server.connections = 0
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    cert_path, _ = ca.issue("127.0.0.1")
+    context.load_cert_chain(cert_path)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def fetch(proxy_port: int, url: str) -> tuple[int, bytes]:
+    """GET a URL through the proxy and return status and body."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    writer.write(f"GET {url} HTTP/1.1\r\nHost: x\r\nAccept-Encoding: identity\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), body
+
+
+async def fetch_https(proxy_port: int, port: int, path: str, context: ssl.SSLContext) -> tuple[int, bytes]:
+    """GET a path from 127.0.0.1 over HTTPS through the proxy's CONNECT."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    writer.write(f"CONNECT 127.0.0.1:{port} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n".encode())
+    await writer.drain()
+    assert (await reader.readuntil(b"\r\n\r\n")).startswith(b"HTTP/1.1 200")
+    await writer.start_tls(context, server_hostname="127.0.0.1")
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAccept-Encoding: identity\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), body
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, dict[str, str], bytes]:
+    """Read one response from a kept-alive connection."""
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = {}
+    for line in head[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.lower()] = value.strip()
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while size := int(await reader.readuntil(b"\r\n"), 16):
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+        await reader.readexactly(2)
+    else:
+        body = await reader.read()
+    return int(head[0].split(" ")[1]), headers, body
+
+
+async def fetch_many(reader, writer, urls: list[str]) -> list[tuple[int, dict[str, str], bytes]]:
+    """GET several URLs one after another on one connection."""
+    responses = []
+    for url in urls:
+        writer.write(f"GET {url} HTTP/1.1\r\nHost: x\r\nAccept-Encoding: identity\r\n\r\n".encode())
+        await writer.drain()
+        responses.append(await read_response(reader))
+    writer.close()
+    return responses
+
+
+def run_with_proxy(tmp_path, coro_factory, max_bytes=1024 * 1024, static_ttl=3600, ca=None, intercept_ports=()):
+    async def main():
+        proxy = CacheProxy(
+            DiskCache(tmp_path / "cache", max_bytes), static_ttl=static_ttl, max_object_bytes=max_bytes,
+            ca=ca, upstream_context=ssl.create_default_context(cafile=ca.cert_path) if ca else None,
+            intercept_ports=intercept_ports,
+        )
+        await proxy.start("127.0.0.1", 0)
+        try:
+            return await coro_factory(proxy)
+        finally:
+            await proxy.stop()
+
+    return asyncio.run(main())
+
+
+class TestCacheProxy:
+    """Test the shared subresource caching proxy against a local origin."""
+
+    def test_fresh_response_served_from_cache(self, origin, tmp_path):
+        """Test a response with max-age is fetched from origin only once."""
+        url = f"http://127.0.0.1:{origin.server_port}/cached"
+        saved_before = metrics.get("cache_proxy_bytes_saved_total")
+
+        async def scenario(proxy):
+            return [await fetch(proxy.port, url) for _ in range(3)]
+
+        results = run_with_proxy(tmp_path, scenario)
+        assert results == [(200, b"cached body")] * 3
+        assert origin.hits["/cached"] == 1
+        assert metrics.get("cache_proxy_bytes_saved_total") - saved_before == 2 * len(b"cached body")
+
+    def test_no_store_not_cached(self, origin, tmp_path):
+        """Test a no-store response always goes to origin."""
+        url = f"http://127.0.0.1:{origin.server_port}/no-store"
+
+        async def scenario(proxy):
+            return [await fetch(proxy.port, url) for _ in range(2)]
+
+        assert run_with_proxy(tmp_path, scenario) == [(200, b"no-store body")] * 2
+        assert origin.hits["/no-store"] == 2
+
+    def test_static_override(self, origin, tmp_path):
+        """Test static assets without cache headers are cached with the override TTL."""
+        base = f"http://127.0.0.1:{origin.server_port}"
+
+        async def scenario(proxy):
+            for _ in range(2):
+                await fetch(proxy.port, f"{base}/app.js")
+                await fetch(proxy.port, f"{base}/page")
+
+        run_with_proxy(tmp_path, scenario)
+        assert origin.hits["/app.js"] == 1
+        assert origin.hits["/page"] == 2
+
+    def test_revalidation(self, origin, tmp_path):
+        """Test a stale entry with an ETag is revalidated and served from cache."""
+        url = f"http://127.0.0.1:{origin.server_port}/etag"
+
+        async def scenario(proxy):
+            return [await fetch(proxy.port, url) for _ in range(2)]
+
+        results = run_with_proxy(tmp_path, scenario, static_ttl=0)
+        assert results == [(200, b"body{}")] * 2
+        assert origin.hits["/etag"] == 2
+
+    def test_lru_eviction(self, origin, tmp_path):
+        """Test the least recently used entry is evicted to stay within the size bound."""
+        base = f"http://127.0.0.1:{origin.server_port}"
+
+        async def scenario(proxy):
+            for path in ("/a.css", "/b.css", "/a.css", "/c.css"):
+                await fetch(proxy.port, f"{base}{path}")
+            size = proxy.cache.size
+            for path in ("/a.css", "/c.css", "/b.css"):
+                await fetch(proxy.port, f"{base}{path}")
+            return size
+
+        size = run_with_proxy(tmp_path, scenario, max_bytes=20)
+        assert size == 20
+        # a.css was used after b.css, so b.css was the one evicted for c.css
+        assert origin.hits == {"/a.css": 1, "/b.css": 2, "/c.css": 1}
+
+    def test_https_intercepted_and_cached(self, tls_origin, ca, tmp_path):
+        """Test HTTPS through CONNECT is intercepted with the CA and cached."""
+        client_context = ssl.create_default_context(cafile=ca.cert_path)
+
+        async def scenario(proxy):
+            return [
+                await fetch_https(proxy.port, tls_origin.server_port, path, client_context)
+                for path in ("/app.js", "/app.js", "/page", "/page")
+            ]
+
+        results = run_with_proxy(tmp_path, scenario, ca=ca, intercept_ports=(tls_origin.server_port,))
+        assert results == [(200, b"console.log(1);")] * 2 + [(200, b"uncacheable page")] * 2
+        assert tls_origin.hits == {"/app.js": 1, "/page": 2}
+
+    def test_https_untrusted_client(self, tls_origin, ca, tmp_path):
+        """Test a client not trusting the proxy CA fails the handshake without reaching origin."""
+        async def scenario(proxy):
+            with pytest.raises(ssl.SSLCertVerificationError):
+                await fetch_https(proxy.port, tls_origin.server_port, "/app.js", ssl.create_default_context())
+
+        run_with_proxy(tmp_path, scenario, ca=ca, intercept_ports=(tls_origin.server_port,))
+        assert tls_origin.hits == {}
+
+    def test_keep_alive_and_upstream_reuse(self, origin, tmp_path):
+        """Test requests share one client connection and one upstream connection."""
+        url = f"http://127.0.0.1:{origin.server_port}/page"
+
+        async def scenario(proxy):
+            return await fetch_many(*await asyncio.open_connection("127.0.0.1", proxy.port), [url] * 3)
+
+        responses = run_with_proxy(tmp_path, scenario)
+        assert [(status, body) for status, _, body in responses] == [(200, b"uncacheable page")] * 3
+        assert "connection" not in responses[0][1]
+        assert origin.hits["/page"] == 3
+        assert origin.connections == 1
+
+    def test_chunked_response(self, origin, tmp_path):
+        """Test a chunked upstream body is passed on chunked and cached whole."""
+        url = f"http://127.0.0.1:{origin.server_port}/chunked"
+
+        async def scenario(proxy):
+            return await fetch_many(*await asyncio.open_connection("127.0.0.1", proxy.port), [url] * 2)
+
+        first, second = run_with_proxy(tmp_path, scenario)
+        assert first[1]["transfer-encoding"] == "chunked"
+        assert first[2] == second[2] == b"first second"
+        assert second[1]["content-length"] == "12"
+        assert origin.hits["/chunked"] == 1
+
+    def test_https_keep_alive(self, tls_origin, ca, tmp_path):
+        """Test several requests are served inside one intercepted tunnel."""
+        port = tls_origin.server_port
+
+        async def scenario(proxy):
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+            writer.write(f"CONNECT 127.0.0.1:{port} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n".encode())
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+            await writer.start_tls(ssl.create_default_context(cafile=ca.cert_path), server_hostname="127.0.0.1")
+            return await fetch_many(reader, writer, ["/page", "/app.js", "/app.js"])
+
+        responses = run_with_proxy(tmp_path, scenario, ca=ca, intercept_ports=(port,))
+        assert [body for _, _, body in responses] == [b"uncacheable page"] + [b"console.log(1);"] * 2
+        assert tls_origin.hits == {"/page": 1, "/app.js": 1}
+        assert tls_origin.connections == 1
+
+    def test_connect_to_other_ports_tunnelled(self, origin, ca, tmp_path):
+        """Test CONNECT outside the intercepted ports, e.g. plain ws://, is tunnelled unchanged."""
+        port = origin.server_port
+
+        async def scenario(proxy):
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+            writer.write(f"CONNECT 127.0.0.1:{port} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n\r\n".encode())
+            await writer.drain()
+            await reader.readuntil(b"\r\n\r\n")
+            return await fetch_many(reader, writer, ["/cached", "/cached"])
+
+        responses = run_with_proxy(tmp_path, scenario, ca=ca, intercept_ports=(443,))
+        assert [body for _, _, body in responses] == [b"cached body"] * 2
+        assert origin.hits["/cached"] == 2
+
+
+class TestRendererProxySettings:
+    """Test how renderer processes are pointed at the proxy."""
+
+    def test_https_direct_without_interception(self):
+        """Test only plain HTTP is proxied when TLS is not intercepted."""
+        set_proxy_url("http://127.0.0.1:9001")
+        try:
+            env = renderer_env()
+            assert env["HTTP_PROXY"] == "http://127.0.0.1:9001"
+            assert env.get("HTTPS_PROXY") != "http://127.0.0.1:9001"
+            assert renderer_proxy_args() == []
+        finally:
+            set_proxy_url(None)
+
+    def test_https_proxied_with_interception(self, ca):
+        """Test HTTPS is proxied and the renderer gets the CA when TLS is intercepted."""
+        set_proxy_url("http://127.0.0.1:9001", ca)
+        try:
+            assert renderer_env()["HTTPS_PROXY"] == "http://127.0.0.1:9001"
+            assert renderer_proxy_args() == [
+                "--proxy-ca", str(ca.cert_path), "--proxy-ca-spki", ca.spki_hash,
+            ]
+        finally:
+            set_proxy_url(None)
+        assert renderer_env() is None
@@ -0,0 +1,51 @@
+import asyncio
+import sys
+
+import pytest
+
+from app.config import settings
+from app.renderer import RendererError, run_renderer
+from app.retries import is_transient
+
+STUB = '''\
+import sys
+
+out = sys.stdout.buffer
+out.write(b"JWRF\\x01H\\x00\\x00\\x00\\x10<html>")
+out.flush()
+sys.stderr.write("Page crashed: Target closed\\n")
+sys.exit(int(sys.argv[sys.argv.index("--wait") + 1]))
+'''
+
+
+@pytest.fixture(autouse=True)
+def renderer(tmp_path, monkeypatch):
+    script = tmp_path / "renderer.py"
+    script.write_text(f"#!{sys.executable}\n{STUB}")
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "JS_WEB_RENDERER_PATH", script)
+    monkeypatch.setattr(settings, "SCRATCH_DIR", tmp_path / "scratch")
+    monkeypatch.setattr(settings, "RENDERER_FRAMED_OUTPUT", True)
+
+
+def render(exit_code: int) -> RendererError:
+    # The stub exits with the code passed as --wait
+    with pytest.raises(RendererError) as info:
+        asyncio.run(run_renderer("https://example.com", wait=exit_code))
+    return info.value
+
+
+class TestRunRenderer:
+    """Test run_renderer against a stub renderer script."""
+
+    def test_crash_mid_output(self):
+        """Test a renderer dying before its end frame reports its stderr, and is retried."""
+        error = render(1)
+        assert str(error) == "Page crashed: Target closed"
+        assert is_transient(error)
+
+    def test_truncated_output_after_clean_exit(self):
+        """Test output cut short by a renderer that exited 0 is a protocol error."""
+        error = render(0)
+        assert str(error) == "Renderer output ended without end frame"
+        assert not is_transient(error)
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from app import retries
+from app.config import settings
+from app.metrics import metrics
+from app.renderer import ConcurrencyLimitError, DrainingError, RendererError, RendererTimeoutError
+from app.retries import LatencyTracker, is_transient, render_with_retries
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Stub run_renderer: each call takes the next (delay, outcome) pair and logs what happened."""
+    script = []
+    log = []
+
+    async def run_renderer(**kwargs):
+        call = len(log)
+        delay, outcome = script[call]
+        log.append("started")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log[call] = "cancelled"
+            raise
+        log[call] = "finished"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(retries, "run_renderer", run_renderer)
+    monkeypatch.setattr(retries, "latency_tracker", LatencyTracker())
+    monkeypatch.setattr(settings, "BREAKER_ENABLED", False)
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+    monkeypatch.setattr(settings, "RENDER_RETRIES", 2)
+    monkeypatch.setattr(settings, "RETRY_BACKOFF", 0.0)
+    return script, log
+
+
+def render(**kwargs) -> dict:
+    return asyncio.run(render_with_retries(url="https://example.com/", wait=0, **kwargs))
+
+
+class TestRetries:
+    """Test transient error classification and latency percentiles."""
+
+    def test_transient_errors(self):
+        """Test timeouts and network errors are retried, others are not."""
+        assert is_transient(RendererTimeoutError("Renderer timed out"))
+        assert is_transient(RendererError("net::ERR_CONNECTION_RESET at https://example.com"))
+        assert is_transient(RendererError("Renderer exited with code -9"))
+        assert not is_transient(RendererError("Renderer exited with code 2"))
+        assert not is_transient(ConcurrencyLimitError("Too many concurrent render requests."))
+
+    def test_percentile_needs_min_samples(self):
+        """Test no percentile is reported before enough samples exist."""
+        tracker = LatencyTracker()
+        for duration in (1.0, 2.0):
+            tracker.record("example.com", duration)
+        assert tracker.percentile("example.com", 0.95, min_samples=3) is None
+        assert tracker.percentile("other.com", 0.95, min_samples=0) is None
+
+    def test_percentile(self):
+        """Test percentile over recent samples only."""
+        tracker = LatencyTracker(samples_per_host=10)
+        for duration in range(1, 21):
+            tracker.record("example.com", float(duration))
+        assert tracker.percentile("example.com", 0.5, min_samples=1) == 15.0
+        assert tracker.percentile("example.com", 0.95, min_samples=1) == 20.0
+
+    def test_hosts_bounded(self):
+        """Test least recently rendered hosts are forgotten."""
+        tracker = LatencyTracker(max_hosts=2)
+        for host in ("a.com", "b.com", "c.com"):
+            tracker.record(host, 1.0)
+        assert tracker.percentile("a.com", 0.5, min_samples=1) is None
+        assert tracker.percentile("c.com", 0.5, min_samples=1) == 1.0
+
+    def test_hedge_latency_net_of_waits(self, monkeypatch):
+        """Test a render with a longer wait than usual is not hedged for it."""
+        tracker = LatencyTracker()
+        calls = []
+
+        async def run_renderer(**kwargs):
+            calls.append(kwargs["wait"])
+            await asyncio.sleep(kwargs["wait"] + 0.05)
+            return {"success": True}
+
+        monkeypatch.setattr(retries, "latency_tracker", tracker)
+        monkeypatch.setattr(retries, "run_renderer", run_renderer)
+        monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 1)
+        monkeypatch.setattr(settings, "HEDGE_MIN_DELAY", 0.2)
+
+        asyncio.run(retries._hedged_attempt("example.com", True, url="https://example.com", wait=0))
+        assert tracker.percentile("example.com", 0.5, min_samples=1) < 0.2
+        asyncio.run(retries._hedged_attempt("example.com", True, url="https://example.com", wait=1))
+        assert calls == [0, 1]
+
+
+class TestRenderWithRetries:
+    """Test retries and hedging against a stubbed renderer."""
+
+    def test_transient_failure_retried(self, renders):
+        """Test a transient failure is retried and the retry's result returned."""
+        script, log = renders
+        script += [(0, RendererTimeoutError("Renderer timed out")), (0, {"html": "ok"})]
+        assert render() == {"html": "ok"}
+        assert log == ["finished", "finished"]
+
+    def test_permanent_failure_not_retried(self, renders):
+        """Test a non-transient failure is raised without a retry."""
+        script, log = renders
+        script += [(0, RendererError("Renderer exited with code 2")), (0, {"html": "ok"})]
+        with pytest.raises(RendererError, match="code 2"):
+            render()
+        assert len(log) == 1
+
+    def test_actions_not_retried(self, renders):
+        """Test renders with click actions are not repeated."""
+        script, log = renders
+        script += [(0, RendererTimeoutError("Renderer timed out")), (0, {"html": "ok"})]
+        with pytest.raises(RendererTimeoutError):
+            render(click_actions=["#buy"])
+        assert len(log) == 1
+
+    def test_slot_lost_on_retry_reports_original(self, renders):
+        """Test a retry refused for lack of a slot surfaces the failure that caused it."""
+        script, log = renders
+        script += [
+            (0, RendererTimeoutError("Renderer timed out")),
+            (0, ConcurrencyLimitError("Too many concurrent render requests.")),
+        ]
+        with pytest.raises(RendererTimeoutError):
+            render()
+        assert len(log) == 2
+
+    def test_hedge_wins_and_original_cancelled(self, renders, monkeypatch):
+        """Test a slow render is hedged, the hedge's result returned and the original cancelled."""
+        script, log = renders
+        monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+        monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 1)
+        monkeypatch.setattr(settings, "HEDGE_MIN_DELAY", 0.05)
+        retries.latency_tracker.record("example.com", 0.01)
+        wins = metrics.get("render_hedge_wins_total")
+        script += [(10, {"html": "original"}), (0, {"html": "hedge"})]
+        assert render() == {"html": "hedge"}
+        assert log == ["cancelled", "finished"]
+        assert metrics.get("render_hedge_wins_total") == wins + 1
+
+    def test_refused_hedge_does_not_mask_original(self, renders, monkeypatch):
+        """Test the original's error is raised when the hedge was turned away."""
+        script, log = renders
+        monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+        monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 1)
+        monkeypatch.setattr(settings, "HEDGE_MIN_DELAY", 0.05)
+        monkeypatch.setattr(settings, "RENDER_RETRIES", 0)
+        retries.latency_tracker.record("example.com", 0.01)
+        script += [
+            (0.2, RendererError("net::ERR_CONNECTION_RESET")),
+            (0, DrainingError("Server is shutting down", 30)),
+        ]
+        with pytest.raises(RendererError, match="ERR_CONNECTION_RESET"):
+            render()
+        assert log == ["finished", "finished"]
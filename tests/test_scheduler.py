@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from app.scheduler import Scheduler, ScheduleStore
+
+
+class CountingStore(ScheduleStore):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.queries = 0
+
+    def due(self, *args):
+        self.queries += 1
+        return super().due(*args)
+
+
+class TestScheduler:
+    """Test schedule dispatch against a local SQLite store."""
+
+    def test_running_schedules_excluded(self, tmp_path):
+        """Test a running schedule is neither due nor counted for the next wakeup."""
+        store = ScheduleStore(tmp_path / "s.db", 5)
+        schedule = store.create("render", {"url": "https://example.com"}, 3600, 0)
+        store.set_next_run(schedule["id"], 0)
+        assert [s["id"] for s in store.due(time.time())] == [schedule["id"]]
+        assert store.due(time.time(), {schedule["id"]}) == []
+        assert store.next_due() == 0
+        assert store.next_due({schedule["id"]}) is None
+        store.close()
+
+    def test_loop_idles_while_schedule_runs(self, tmp_path):
+        """Test the loop does not poll the store while an overdue schedule is running."""
+        store = CountingStore(tmp_path / "s.db", 5)
+        schedule = store.create("render", {"url": "https://example.com"}, 3600, 0)
+        store.set_next_run(schedule["id"], 0)
+        started = []
+
+        async def runner(kind, request):
+            started.append(kind)
+            await asyncio.sleep(1)
+            return {"success": True}, None
+
+        async def main():
+            scheduler = Scheduler(store, runner, 2)
+            scheduler.start()
+            await asyncio.sleep(0.8)
+            queries = store.queries
+            await scheduler.stop()
+            return queries
+
+        assert asyncio.run(main()) <= 2
+        assert started == ["render"]
+        store.close()
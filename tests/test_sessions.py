@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+import pytest
+
+from app import main, sessions
+from app.config import settings
+from app.models import SessionRequest, SessionStep
+from app.sessions import RendererSession
+
+STUB = '''\
+import json, os, struct, sys, time
+from pathlib import Path
+
+assert "--session" in sys.argv and "--framed-output" in sys.argv
+out = sys.stdout.buffer
+
+def frame(frame_type, payload):
+    out.write(frame_type + struct.pack(">I", len(payload)) + payload)
+
+out.write(b"JWRF\\x01")
+out.flush()
+for line in sys.stdin:
+    step = json.loads(line)
+    if step["post_js"] == "fail":
+        frame(b"X", b"step failed")
+    else:
+        if step["post_js"] == "hang":
+            Path(__file__).with_name("pid").write_text(str(os.getpid()))
+            time.sleep(100)
+        frame(b"M", json.dumps({"current_url": step["url"]}).encode())
+        frame(b"H", f"<p>{step['url']}</p>".encode())
+    frame(b"E", b"")
+    out.flush()
+'''
+
+
+@pytest.fixture(autouse=True)
+def renderer(tmp_path, monkeypatch):
+    script = tmp_path / "renderer.py"
+    script.write_text(f"#!{sys.executable}\n{STUB}")
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "JS_WEB_RENDERER_PATH", script)
+    monkeypatch.setattr(settings, "SCRATCH_DIR", tmp_path / "scratch")
+    monkeypatch.setattr(settings, "API_KEY", "test-key")
+    monkeypatch.setattr(settings, "MAX_SESSIONS", 1)
+    monkeypatch.setattr(settings, "SESSIONS_ENABLED", True)
+    return tmp_path
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.05)
+
+
+def process_gone(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+def run_session(steps: list[dict], idle_timeout: int = 30) -> list:
+    async def main():
+        session = RendererSession(SessionRequest(steps=steps, idle_timeout=idle_timeout))
+        try:
+            await session.start()
+            results = []
+            for index, step in enumerate(session.request.steps):
+                results.append(await session.run_step(index, step))
+            return results
+        finally:
+            await session.close()
+
+    return asyncio.run(main())
+
+
+class TestRendererSession:
+    """Test renderer sessions against a stub renderer script."""
+
+    def test_steps(self, renderer):
+        """Test each step gets its own result and the session is cleaned up after."""
+        results = run_session([{"url": "https://example.com"}, {"url": "https://example.org"}])
+        assert [(r.index, r.success, r.html) for r in results] == [
+            (0, True, "<p>https://example.com</p>"),
+            (1, True, "<p>https://example.org</p>"),
+        ]
+        assert results[1].current_url == "https://example.org"
+        assert sessions.get_active_sessions() == 0
+        assert list((renderer / "scratch").iterdir()) == []
+
+    def test_failed_step(self):
+        """Test an error frame fails the step without ending the session."""
+        results = run_session([{"url": "https://example.com", "post_js": "fail"}, {"url": "https://example.org"}])
+        assert (results[0].success, results[0].error) == (False, "step failed")
+        assert results[1].success
+
+    def test_step_timeout(self, renderer):
+        """Test a step running past its idle timeout fails and kills the renderer."""
+        results = run_session([{"url": "https://example.com", "post_js": "hang"}], idle_timeout=1)
+        assert (results[0].success, results[0].error) == (False, "Session step timed out")
+        assert process_gone(int((renderer / "pid").read_text()))
+        assert sessions.get_active_sessions() == 0
+
+    def test_session_limit(self):
+        """Test sessions beyond the limit are refused."""
+        async def main():
+            request = SessionRequest(steps=[SessionStep()])
+            session = RendererSession(request)
+            try:
+                with pytest.raises(sessions.ConcurrencyLimitError):
+                    RendererSession(request)
+            finally:
+                await session.close()
+
+        asyncio.run(main())
+        assert sessions.get_active_sessions() == 0
+
+
+class TestSessionEndpoint:
+    """Test the session endpoint called as an ASGI app."""
+
+    def test_disabled(self, monkeypatch):
+        """Test sessions answer 501 unless enabled."""
+        monkeypatch.setattr(settings, "SESSIONS_ENABLED", False)
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                return await client.post(
+                    "/session", json={"steps": [{"url": "https://example.com"}]}, headers={"X-API-Key": "test-key"}
+                )
+
+        assert asyncio.run(scenario()).status_code == 501
+
+    @pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+    def test_disconnect_mid_step(self, renderer, spec_version):
+        """Test a client disconnect mid-step kills the renderer and releases the session."""
+        pid_file = renderer / "pid"
+        body = json.dumps({"steps": [{"url": "https://example.com", "post_js": "hang"}]}).encode()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": spec_version},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/session",
+            "raw_path": b"/session",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"x-api-key", b"test-key")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("127.0.0.1", 8000),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            while not pid_file.exists():
+                await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        async def scenario():
+            await main.app(scope, receive, send)
+            # Workspace removal is shielded from the cancellation and finishes in the background
+            while list((renderer / "scratch").iterdir()):
+                await asyncio.sleep(0.05)
+
+        asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+        assert sent[0]["status"] == 200
+        wait_until(lambda: process_gone(int(pid_file.read_text())))
+        assert sessions.get_active_sessions() == 0